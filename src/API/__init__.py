@@ -5,5 +5,7 @@ app = Flask(__name__)
 
 def index():
     from .endpoints import endpoints
+    from .admin import admin
     app.register_blueprint(endpoints, url_prefix="/")
+    app.register_blueprint(admin, url_prefix="/admin")
     return app
@@ -0,0 +1,103 @@
+import codecs
+import hmac
+import os
+from datetime import datetime, timezone
+from flask import Blueprint, Response, abort, jsonify, request
+from profiling import DEFAULT_SAMPLE_INTERVAL, MAX_SAMPLE_SECONDS, collapsed, sample_stacks
+from user_agents import get_user_agent_pool
+
+# admin routes are disabled unless a token is configured
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+admin = Blueprint('admin', __name__)
+
+
+def is_admin() -> bool:
+    """True if the request carries the configured X-Admin-Token"""
+    token = request.headers.get('X-Admin-Token')
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+@admin.before_request
+def require_admin():
+    if not ADMIN_TOKEN:
+        abort(404)
+
+    if not is_admin():
+        return jsonify({
+            'message': 'admin token required'
+        }), 403
+
+
+@admin.route('/profile')
+def profile():
+    """Sample all threads for `seconds` and return the stacks in the collapsed (flamegraph) format"""
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval = float(request.args.get('interval', DEFAULT_SAMPLE_INTERVAL))
+    except ValueError:
+        return jsonify({
+            'message': 'seconds and interval must be numbers'
+        }), 400
+
+    if not 0 < seconds <= MAX_SAMPLE_SECONDS or interval <= 0:
+        return jsonify({
+            'message': f'seconds must be in (0, {MAX_SAMPLE_SECONDS}] and interval positive'
+        }), 400
+
+    return Response(collapsed(sample_stacks(seconds, interval)), mimetype='text/plain')
+
+
+@admin.route('/user-agents')
+def user_agents():
+    """Success and throttle counts of the user agents used by this worker"""
+    pool = get_user_agent_pool()
+    return jsonify({
+        'total': len(pool.agents),
+        'evicted': pool.evicted,
+        'used': pool.stats()
+    })
+
+
+@admin.route('/crawler')
+def crawler_report():
+    """Pace, schedule and adaptive interval savings of the watchlist crawler running in this process"""
+    import crawler
+
+    if crawler.running is None:
+        return jsonify({
+            'message': 'no crawler runs in this process, see the output of crawler.py'
+        }), 404
+
+    return jsonify(crawler.running.report())
+
+
+@admin.route('/export/<table>', methods=['POST'])
+def export_table(table: str):
+    """Stream a table (stats or contests) of the users in the body, one username per line, as CSV, Parquet or
+    Arrow in row groups. Users missing from the result cache are scraped unless `scrape=0`."""
+    import export
+
+    if table not in export.TABLES:
+        return jsonify({
+            'message': f'unknown table, expected one of {", ".join(export.TABLES)}'
+        }), 404
+
+    fmt = request.args.get('format', export.EXPORT_FORMAT)
+    now = datetime.now(timezone.utc)
+    # read line by line while the rows are streamed, the roster is never held in memory as a whole
+    usernames = export.parse_roster(codecs.iterdecode(request.stream, 'utf-8'))
+    rows = export.table_rows(table, usernames, now.isoformat(timespec='seconds'),
+                             scrape=request.args.get('scrape') != '0')
+
+    try:
+        chunks = export.stream_table(rows, export.TABLES[table][0], fmt)
+    except ValueError as err:
+        return jsonify({
+            'message': str(err)
+        }), 400
+
+    extension, mimetype = export.FORMATS[fmt]
+    response = Response(chunks, mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={table}-{now.date().isoformat()}.{extension}'
+    return response
@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from hashlib import blake2b
+from urllib.parse import quote
+from metrics import CACHE_REQUESTS
+from .compression import compress
+
+RESULT_CACHE_TTL = int(os.environ.get('RESULT_CACHE_TTL', 0))  # in seconds, 0 (the default) disables the cache
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', 1024))  # entries per worker
+# directory shared by all workers and the crawler, bodies are kept there as files next to the in-memory LRU
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR')
+
+# Cache-Control of the GET routes per section: (max-age, stale-while-revalidate) in seconds. Past contest results
+# never change, only new contests get added, while rating and ranks move with every contest.
+HTTP_CACHE_CONTROL = {
+    'contests': (3600, 86400),
+    'solved': (900, 3600),
+    'submissions': (900, 3600),
+    'stats': (60, 300),
+}
+
+
+class CacheEntry:
+    """Scraped result together with its serialized JSON body, the body's hash and its compressed variants
+
+    `result` is None for entries read back from RESULT_CACHE_DIR, only the body is stored on disk.
+    """
+    __slots__ = ('result', 'body', 'digest', 'expires', 'variants')
+
+    def __init__(self, result, body: bytes, expires: float):
+        self.result = result
+        self.body = body
+        self.digest = blake2b(body, digest_size=16).hexdigest()
+        self.expires = expires
+        self.variants = {}
+
+    def etag(self, encoding: str) -> str:
+        """Strong ETag of the body in the given content coding, every coding is a different representation"""
+        return self.digest if encoding is None else f'{self.digest}-{encoding}'
+
+    def encoded(self, encoding: str) -> bytes:
+        """Body in the given content coding, compressed on first use and kept with the entry"""
+        if encoding is None:
+            return self.body
+
+        body = self.variants.get(encoding)
+
+        if body is None:
+            # two threads may both compress the same variant, the result is identical so no lock is needed
+            body = self.variants[encoding] = compress(self.body, encoding, cached=True)
+
+        return body
+
+
+class ResultCache:
+    """LRU cache with expiry for successful scraper results, keyed by section and username
+
+    With a directory every entry is also written there as a file whose mtime is its expiry time, so other
+    processes (workers, the crawler) can serve it.
+
+    Args:
+        ttl (int): default seconds an entry stays valid, 0 disables the cache
+        size (int): maximum number of entries in memory
+        directory (str): optional directory shared between processes
+    """
+
+    def __init__(self, ttl: int, size: int, directory: str = None):
+        self.ttl = ttl
+        self.size = size
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.listeners = {}  # section -> callbacks of put
+
+    @staticmethod
+    def key(section: str, username: str) -> tuple:
+        # codechef usernames are case insensitive
+        return section, username.lower()
+
+    def path(self, section: str, username: str) -> str:
+        return os.path.join(self.directory, section, quote(username.lower(), safe='') + '.json')
+
+    def get(self, section: str, username: str):
+        """Fresh entry for section and username, None on a miss"""
+        if not self.ttl:
+            return None
+
+        key = self.key(section, username)
+        result = 'hit'
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None and entry.expires < time.time():
+                del self.entries[key]
+                entry = None
+
+            if entry is not None:
+                self.entries.move_to_end(key)
+
+        if entry is None and self.directory:
+            entry = self.read(section, username)
+            result = 'disk_hit'
+
+            if entry is not None:
+                self.remember(key, entry)
+
+        CACHE_REQUESTS.inc(cache=section, result='miss' if entry is None else result)
+        return entry
+
+    def on_put(self, section: str, callback):
+        """Call callback(username, result) with every result put into section, i.e. after every successful scrape,
+        also when the cache is disabled"""
+        self.listeners.setdefault(section, []).append(callback)
+
+    def put(self, section: str, username: str, result, body: bytes, ttl: int = None) -> CacheEntry:
+        """Store a result and its body
+
+        Args:
+            ttl (int): seconds the entry stays valid, defaults to the cache's ttl. Stored with a ttl even when
+                the cache is disabled, so the crawler fills RESULT_CACHE_DIR for API workers that enabled it
+        """
+        entry = CacheEntry(result, body, time.time() + (ttl or self.ttl))
+
+        if ttl or self.ttl:
+            self.remember(self.key(section, username), entry)
+
+            if self.directory:
+                self.write(section, username, entry)
+
+        # after storing, so a listener reloading from the cache sees the entry
+        for callback in self.listeners.get(section, ()):
+            try:
+                callback(username, result)
+            except Exception as err:
+                # a failing listener must not fail the request that scraped the result
+                print(f'error -> {err}')
+
+        return entry
+
+    def remember(self, key: tuple, entry: CacheEntry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def read(self, section: str, username: str):
+        """Entry stored in the directory, None if there is none or it expired"""
+        path = self.path(section, username)
+
+        try:
+            expires = os.stat(path).st_mtime
+
+            if expires < time.time():
+                return None
+
+            with open(path, 'rb') as file:
+                return CacheEntry(None, file.read(), expires)
+
+        except OSError:
+            return None
+
+    def write(self, section: str, username: str, entry: CacheEntry):
+        path = self.path(section, username)
+        # unique per thread, two threads may write the same entry
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temporary, 'wb') as file:
+                file.write(entry.body)
+            os.utime(temporary, (entry.expires, entry.expires))
+            os.replace(temporary, path)
+
+        except OSError as err:
+            print(f'error -> {err}')
+
+
+result_cache = ResultCache(RESULT_CACHE_TTL, RESULT_CACHE_SIZE, RESULT_CACHE_DIR)
@@ -0,0 +1,69 @@
+import gzip
+import os
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))  # in bytes, smaller bodies are sent as is
+COMPRESSIBLE_TYPES = {'application/json', 'text/plain', 'text/csv', 'text/html'}
+
+# per request compression runs on every response so it uses cheap levels, cached bodies are compressed once
+# and sent many times so they get more expensive ones where that pays off. On the 813 KiB contests body of the
+# large_user fixture (benchmarks.serialization_benchmark): brotli 5 -> 26.5 KiB in 5 ms, 9 -> 24.2 KiB in 15 ms,
+# 11 takes over 2 s; zstd 3 -> 35.9 KiB in 1 ms, 12 -> 27.5 KiB in 9 ms, 16 and up are slower and larger;
+# gzip 9 is no smaller than 6, so gzip uses 6 for both
+LEVELS = {
+    False: {'zstd': 3, 'br': 5, 'gzip': 6},
+    True: {'zstd': 12, 'br': 9, 'gzip': 6},
+}
+
+
+def _compressors() -> dict:
+    found = {}
+
+    if zstandard is not None:
+        found['zstd'] = lambda body, level: zstandard.ZstdCompressor(level=level).compress(body)
+
+    if brotli is not None:
+        found['br'] = lambda body, level: brotli.compress(body, quality=level)
+
+    found['gzip'] = lambda body, level: gzip.compress(body, compresslevel=level, mtime=0)
+    return found
+
+
+# in order of preference when the client accepts several with the same quality
+COMPRESSORS = _compressors()
+
+
+def negotiate() -> str:
+    """Best encoding the client accepts for the current request, None for identity"""
+    return request.accept_encodings.best_match(list(COMPRESSORS))
+
+
+def compress(body: bytes, encoding: str, cached: bool = False) -> bytes:
+    """Compress body with one of COMPRESSORS
+
+    Args:
+        body (bytes): response body
+        encoding (str): content coding, e.g. gzip
+        cached (bool): True if the result is stored and reused, picks a slower but smaller level
+
+    Returns:
+        bytes: compressed body
+    """
+    return COMPRESSORS[encoding](body, LEVELS[cached][encoding])
+
+
+def is_compressible(response) -> bool:
+    """True if the response is worth compressing"""
+    return (response.mimetype in COMPRESSIBLE_TYPES and response.status_code >= 200 and
+            response.status_code not in (204, 304) and not response.direct_passthrough and
+            not response.is_streamed and 'Content-Encoding' not in response.headers)
@@ -1,10 +1,179 @@
-from flask import Blueprint, jsonify, request
+import time
+from flask import Blueprint, Response, g, jsonify, request
 from scraping_code import BASE_URL, get_all_solved_links, get_user_stats, get_submissions_details, \
     multiple_threads_scraping
+from .admin import is_admin
+from .cache import HTTP_CACHE_CONTROL, result_cache
+from .compression import COMPRESSION_MIN_SIZE, compress, is_compressible, negotiate
+from .serialization import dumps, json_response
+from profiling import RequestProfile
+import history
+import metrics
+import timing
+import tracing
 
 endpoints = Blueprint('endpoints', __name__)
 
 
+def status_of(result) -> int:
+    """HTTP status of a scraper result, failed scrapes are dicts carrying their status"""
+    return result.get('status', 200) if isinstance(result, dict) else 200
+
+
+def cached_response(section: str, username: str, scrape, http_cache: bool = False):
+    """Serve section of username from the result cache, scraping and caching it on a miss
+
+    Args:
+        section (str): cache section, e.g. stats or contests
+        username (str): profile name on codechef
+        scrape (callable): scraper returning a result model/dict, or a status dict on failure
+        http_cache (bool): add ETag and Cache-Control headers and answer a matching If-None-Match with 304
+
+    Returns:
+        flask.Response: JSON response, cache hits reuse the stored body (and its compressed variant) without
+            re-encoding
+    """
+    entry = result_cache.get(section, username)
+
+    if entry is None:
+        result = scrape(username)
+        status = status_of(result)
+
+        with timing.stage('serialize'):
+            body = dumps(result)
+
+        if status != 200:
+            response = json_response(body, status)
+            if http_cache:
+                # failures are often transient, do not let a proxy keep them
+                response.headers['Cache-Control'] = 'no-store'
+            return response
+
+        entry = result_cache.put(section, username, result, body)
+
+    compressible = len(entry.body) >= COMPRESSION_MIN_SIZE
+    encoding = negotiate() if compressible else None
+
+    if http_cache and request.if_none_match.contains_weak(entry.etag(encoding)):
+        response = Response(status=304)
+    elif encoding is not None:
+        with timing.stage('compress'):
+            response = json_response(entry.encoded(encoding))
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = json_response(entry.body)
+
+    if compressible:
+        response.vary.add('Accept-Encoding')
+
+    if http_cache:
+        max_age, stale_while_revalidate = HTTP_CACHE_CONTROL[section]
+        response.set_etag(entry.etag(encoding))
+        response.headers['Cache-Control'] = \
+            f'public, max-age={max_age}, stale-while-revalidate={stale_while_revalidate}'
+
+    return response
+
+
+def solved_links(username: str) -> dict:
+    """All solved question links of a user, in the /solved response format"""
+    res = get_all_solved_links(username)
+
+    if res['status'] != 200:
+        return {
+            'status': res['status'],
+            'message': res['message']
+        }
+
+    links = [BASE_URL + link for link in res['links']]
+    return {'total_solved': len(links), 'solved_links': links}
+
+
+# scraper per section of the GET /users/<username>/<section> routes
+SECTIONS = {
+    'stats': get_user_stats,
+    'solved': solved_links,
+    'submissions': get_submissions_details,
+    'contests': multiple_threads_scraping,
+}
+
+
+@endpoints.before_request
+def start_stage_timings():
+    timing.start_request()
+    # POST routes take the username from a header, GET routes from the path
+    username = request.headers.get('username') or (request.view_args or {}).get('username')
+    g.root_span = tracing.start_span(f'{request.method} {request.path}', request.headers.get('traceparent'),
+                                     username=username)
+
+
+@endpoints.after_request
+def add_server_timing(response):
+    timings = timing.current()
+
+    if timings is not None:
+        response.headers['Server-Timing'] = timings.server_timing()
+
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+        metrics.REQUEST_DURATION.observe(time.perf_counter() - timings.start, route=route)
+
+    root_span = g.pop('root_span', None)
+
+    if root_span is not None:
+        span, token = root_span
+        span.set('status', response.status_code)
+        if response.status_code >= 500:
+            span.set_status('ERROR')
+        tracing.end_span(span, token)
+
+    return response
+
+
+@endpoints.after_request
+def compress_response(response):
+    # responses not served from the result cache, cached ones carry their Content-Encoding already
+    if not is_compressible(response) or (response.content_length or 0) < COMPRESSION_MIN_SIZE:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate()
+
+    if encoding is not None:
+        with timing.stage('compress'):
+            response.set_data(compress(response.get_data(), encoding))
+        response.headers['Content-Encoding'] = encoding
+
+    return response
+
+
+@endpoints.before_request
+def start_request_profile():
+    # ?profile=1 answers with a cProfile summary of the request instead of its data, admins only
+    if request.args.get('profile') != '1' or not is_admin():
+        return None
+
+    request_profile = RequestProfile()
+
+    if not request_profile.start():
+        return jsonify({
+            'message': 'another request is being profiled'
+        }), 409
+
+    g.request_profile = request_profile
+
+
+@endpoints.after_request
+def finish_request_profile(response):
+    request_profile = g.pop('request_profile', None)
+
+    if request_profile is None:
+        return response
+
+    request_profile.stop()
+    return Response(request_profile.summary(), mimetype='text/plain')
+
+
 @endpoints.route('/')
 def root():
     data = {
@@ -13,7 +182,14 @@ def root():
             'user-stats': 'return user profile data details',
             'solved': 'return user all solved question links',
             'submission-details': 'return details from submission graph',
-            'contest-details': 'return user all contest participation details'
+            'contest-details': 'return user all contest participation details',
+            'users/<username>/<section>': 'GET variant of the above, section is one of stats, solved, submissions '
+                                          'or contests, cacheable by proxies and browsers',
+            'users/<username>/history': 'return rating, rank, solved problems and stars of every stats scrape',
+            'leaderboard': 'return users ranked by rating, percentiles and a rating histogram of the cached stats, '
+                           'filtered by country, institution, division, stars and rating or grouped by a category',
+            'timings': 'return per-stage timing histograms of this worker',
+            'metrics': 'return metrics in the prometheus text format'
         }
     }
     return jsonify(data)
@@ -24,8 +200,7 @@ def user_stats():
     username = request.headers.get('username')
 
     if username is not None:
-        data = get_user_stats(username)
-        return jsonify(data), data.get('status')
+        return cached_response('stats', username, get_user_stats)
 
     return jsonify({
         'message': 'username not found'
@@ -37,21 +212,7 @@ def solved_question():
     username = request.headers.get('username')
 
     if username:
-        res = get_all_solved_links(username)
-        total_links = 0
-        links = []
-
-        if res['status'] != 200:
-            return jsonify({
-                'status': res['status'],
-                'message': res['message']
-            }), res.get('status')
-
-        for link in res['links']:
-            links.append(BASE_URL + link.get('href'))
-            total_links += 1
-
-        return jsonify({'total_solved': total_links, 'solved_links': links}), res.get('status')
+        return cached_response('solved', username, solved_links)
 
     return jsonify({
         'message': 'username not found'
@@ -63,8 +224,7 @@ def submission_details():
     username = request.headers.get('username')
 
     if username is not None:
-        details = get_submissions_details(username)
-        return jsonify(details), details.get('status')
+        return cached_response('submissions', username, get_submissions_details)
 
     return jsonify({
         'message': 'username not found'
@@ -76,9 +236,94 @@ def contest_details():
     username = request.headers.get('username')
 
     if username is not None:
-        details = multiple_threads_scraping(username)
-        return jsonify(details), details.get('status')
+        return cached_response('contests', username, multiple_threads_scraping)
 
     return jsonify({
         'message': 'username not found'
     }), 400
+
+
+@endpoints.route('/users/<username>/<section>')
+def user_section(username: str, section: str):
+    scrape = SECTIONS.get(section)
+
+    if scrape is None:
+        return jsonify({
+            'message': f'unknown section, expected one of {", ".join(SECTIONS)}'
+        }), 404
+
+    return cached_response(section, username, scrape, http_cache=True)
+
+
+@endpoints.route('/users/<username>/history')
+def user_history(username: str):
+    if history.snapshots is None:
+        return jsonify({
+            'message': 'history is not recorded, set HISTORY_DB'
+        }), 404
+
+    try:
+        start = int(request.args['from']) if 'from' in request.args else None
+        end = int(request.args['to']) if 'to' in request.args else None
+        limit = int(request.args.get('limit', history.HISTORY_MAX_SNAPSHOTS))
+    except ValueError:
+        return jsonify({
+            'message': 'from and to must be unix times in seconds, limit a number'
+        }), 400
+
+    with timing.stage('history'):
+        snapshots = history.snapshots.history(username, start, end, min(limit, history.HISTORY_MAX_SNAPSHOTS))
+
+    return json_response(dumps({'username': username, 'total': len(snapshots), 'snapshots': snapshots}))
+
+
+@endpoints.route('/leaderboard')
+def leaderboard():
+    # imports numpy, which workers only pay for once the leaderboard is used
+    import analytics
+
+    filters = {column: request.args[column] for column in analytics.CATEGORY_COLUMNS if request.args.get(column)}
+    sort = request.args.get('sort', 'rating')
+    group_by = request.args.get('group_by')
+
+    try:
+        if request.args.get('stars'):
+            filters['total_stars'] = int(request.args['stars'])
+        min_rating = float(request.args['min_rating']) if request.args.get('min_rating') else None
+        max_rating = float(request.args['max_rating']) if request.args.get('max_rating') else None
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = min(max(1, int(request.args.get('limit', 100))), 1000)
+        bucket = max(1, int(request.args.get('bucket', 100)))
+    except ValueError:
+        return jsonify({
+            'message': 'stars, min_rating, max_rating, offset, limit and bucket must be numbers'
+        }), 400
+
+    if sort not in analytics.SORTS or group_by not in (None, *analytics.CATEGORY_COLUMNS):
+        return jsonify({
+            'message': f'sort must be one of {", ".join(analytics.SORTS)}, '
+                       f'group_by one of {", ".join(analytics.CATEGORY_COLUMNS)}'
+        }), 400
+
+    with timing.stage('analytics'):
+        table = analytics.user_table()
+        rows = table.select(filters, min_rating, max_rating)
+        data = {'total': len(rows)}
+
+        if group_by is not None:
+            data['groups'] = table.group_by(rows, group_by, offset, limit)
+        else:
+            data['users'] = table.leaderboard(rows, sort, offset, limit)
+            data.update(table.distribution(rows, bucket=bucket))
+
+    return json_response(dumps(data))
+
+
+@endpoints.route('/timings')
+def stage_timings():
+    return jsonify(timing.histograms())
+
+
+@endpoints.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,54 @@
+import json
+import os
+from flask import Response
+
+# auto picks the fastest installed encoder: orjson, then msgspec, then the standard library
+JSON_SERIALIZER = os.environ.get('JSON_SERIALIZER', 'auto')
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def to_builtin(obj):
+    """Encoder hook turning result models into plain data"""
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def _stdlib_dumps(obj) -> bytes:
+    return json.dumps(obj, default=to_builtin, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _msgspec_dumps():
+    encode = msgspec.json.Encoder(enc_hook=to_builtin).encode
+
+    # msgspec encodes dataclasses field by field without asking enc_hook, convert result models first
+    return lambda obj: encode(obj.to_dict() if hasattr(obj, 'to_dict') else obj)
+
+
+def _select_dumps():
+    if JSON_SERIALIZER in ('auto', 'orjson') and orjson is not None:
+        # orjson would encode the dataclass fields itself, passthrough sends the models to to_builtin
+        return 'orjson', lambda obj: orjson.dumps(obj, default=to_builtin, option=orjson.OPT_PASSTHROUGH_DATACLASS)
+
+    if JSON_SERIALIZER in ('auto', 'msgspec') and msgspec is not None:
+        return 'msgspec', _msgspec_dumps()
+
+    return 'json', _stdlib_dumps
+
+
+serializer_name, dumps = _select_dumps()
+
+
+def json_response(body: bytes, status: int = 200) -> Response:
+    """Response around an already serialized JSON body"""
+    return Response(body, status=status, mimetype='application/json')
@@ -0,0 +1,376 @@
+# ===================================================================
+# ======================== User Analytics ===========================
+# ===================================================================
+#
+# Leaderboards, percentiles, rating histograms and group-bys over the stats of every cached user. The stats
+# section of the result cache (RESULT_CACHE_DIR when set, so everything the crawler refreshed, and the
+# entries in memory) is loaded into one NumPy array per column and every aggregate is a vectorized
+# operation, a query over tens of thousands of users takes a few milliseconds. Secondary indexes on country,
+# institution, division, stars and rating buckets answer filters without scanning every user.
+#
+# Stats this process scrapes update the table and its indexes as they are put into the cache. What other
+# processes scrape (workers, the crawler) is picked up when the table is reloaded after ANALYTICS_TTL seconds,
+# by one request while the others keep using the old table.
+#
+# The API imports this module on the first /leaderboard request, not at startup, to keep NumPy out of workers
+# that never serve it. The cache listener is registered by that import, before it there is no table to update.
+
+import json
+import os
+import threading
+import time
+from urllib.parse import unquote
+import numpy as np
+from API.cache import result_cache
+from scraping_code.models import UserStats
+
+ANALYTICS_TTL = int(os.environ.get('ANALYTICS_TTL', 300))  # in seconds, then the table is reloaded
+ANALYTICS_RATING_BUCKET = int(os.environ.get('ANALYTICS_RATING_BUCKET', 100))  # width of the rating index buckets
+
+# stats fields kept as category codes, filters match them case insensitively
+CATEGORY_COLUMNS = ('country', 'institution', 'division')
+# stats fields kept as float64, NaN where codechef shows text (e.g. unranked users)
+NUMBER_COLUMNS = ('rating', 'global_rank', 'country_rank', 'problem_fully_solved', 'total_stars')
+# sort column -> True if higher is better
+SORTS = {
+    'rating': True,
+    'problem_fully_solved': True,
+    'total_stars': True,
+    'global_rank': False,
+    'country_rank': False,
+}
+PERCENTILES = (10, 25, 50, 75, 90, 99)
+# columns with a secondary index, rating_bucket is the rating in ANALYTICS_RATING_BUCKET wide buckets
+INDEX_COLUMNS = CATEGORY_COLUMNS + ('total_stars', 'rating_bucket')
+
+
+def category(column: str, value) -> str:
+    """Normalized category value, divisions are matched as `div 2` whether given as `(Div 2)`, `Div 2` or `2`"""
+    value = str(value or '').strip().strip('()').lower()
+
+    if column == 'division' and value.isdigit():
+        return f'div {value}'
+
+    return value
+
+
+def number(value) -> float:
+    return float(value) if isinstance(value, (int, float)) else np.nan
+
+
+def load_stats():
+    """Stats of every user in the result cache as dicts, memory entries before the disk tier
+
+    Yields:
+        dict: get_user_stats result in its JSON form
+    """
+    seen = set()
+
+    with result_cache.lock:
+        entries = [(username, entry) for (section, username), entry in result_cache.entries.items()
+                   if section == 'stats']
+
+    for username, entry in entries:
+        seen.add(username)
+        yield entry.result.to_dict() if entry.result is not None else json.loads(entry.body)
+
+    if not result_cache.directory:
+        return
+
+    try:
+        files = os.scandir(os.path.join(result_cache.directory, 'stats'))
+    except OSError:
+        return
+
+    with files:
+        for file in files:
+            # expired entries are the last known stats of a user, they are still counted
+            if not file.name.endswith('.json') or unquote(file.name[:-5]) in seen:
+                continue
+
+            try:
+                with open(file.path, 'rb') as body:
+                    yield json.loads(body.read())
+            except (OSError, ValueError) as err:
+                print(f'error -> {err}')
+
+
+class UserTable:
+    """Stats of many users as columns, with secondary indexes, updated user by user
+
+    Every user has a row. The indexes map a value of an INDEX_COLUMNS column to the set of rows holding it, so
+    filters intersect a few row sets instead of scanning every user. Columns grow by doubling their capacity.
+
+    Args:
+        records (iterable): get_user_stats results in their JSON form
+    """
+
+    def __init__(self, records=()):
+        self.lock = threading.RLock()
+        self.size = 0
+        self.rows = {}  # lowercase username -> row
+        self.usernames = np.empty(0, dtype=object)
+        self.numbers = {column: np.empty(0, dtype=np.float64) for column in NUMBER_COLUMNS}
+        # category column -> code of every row, the names of the codes and normalized name -> code
+        self.codes = {column: np.empty(0, dtype=np.int64) for column in CATEGORY_COLUMNS}
+        self.names = {column: [] for column in CATEGORY_COLUMNS}
+        self.lookup = {column: {} for column in CATEGORY_COLUMNS}
+        # index column -> key -> rows, and the sorted array of a (column, key) built on first use after a change
+        self.index = {column: {} for column in INDEX_COLUMNS}
+        self.arrays = {}
+
+        for record in records:
+            self.update(record)
+
+    def code(self, column: str, value) -> int:
+        """Code of a category value, new values get the next one"""
+        lookup = self.lookup[column]
+        code = lookup.setdefault(category(column, value), len(lookup))
+
+        if code == len(self.names[column]):
+            # shown as first seen
+            self.names[column].append(str(value or '').strip())
+
+        return code
+
+    def keys(self, row: int) -> dict:
+        """Index key of every INDEX_COLUMNS column of a row, None for missing numbers"""
+        keys = {column: int(self.codes[column][row]) for column in CATEGORY_COLUMNS}
+        stars = self.numbers['total_stars'][row]
+        rating = self.numbers['rating'][row]
+        keys['total_stars'] = None if np.isnan(stars) else int(stars)
+        keys['rating_bucket'] = None if np.isnan(rating) else int(rating // ANALYTICS_RATING_BUCKET)
+        return keys
+
+    def grow(self):
+        capacity = max(1024, 2 * len(self.usernames))
+        self.usernames = np.resize(self.usernames, capacity)
+
+        for columns in (self.numbers, self.codes):
+            for column, values in columns.items():
+                columns[column] = np.resize(values, capacity)
+
+    def update(self, record: dict):
+        """Add or replace the stats of a user and move its row between index keys"""
+        username = record.get('username')
+
+        if not username:
+            return
+
+        with self.lock:
+            row = self.rows.get(username.lower())
+
+            if row is None:
+                if self.size == len(self.usernames):
+                    self.grow()
+
+                row = self.rows[username.lower()] = self.size
+                self.size += 1
+                before = {}
+            else:
+                before = self.keys(row)
+
+            self.usernames[row] = username
+
+            for column in CATEGORY_COLUMNS:
+                self.codes[column][row] = self.code(column, record.get(column))
+
+            for column in NUMBER_COLUMNS:
+                self.numbers[column][row] = number(record.get(column))
+
+            for column, key in self.keys(row).items():
+                if column in before and before[column] == key:
+                    continue
+
+                if before.get(column) is not None:
+                    self.index[column][before[column]].discard(row)
+                    self.arrays.pop((column, before[column]), None)
+
+                if key is not None:
+                    self.index[column].setdefault(key, set()).add(row)
+                    self.arrays.pop((column, key), None)
+
+    def indexed(self, column: str, key) -> np.ndarray:
+        """Sorted rows of an index key"""
+        rows = self.arrays.get((column, key))
+
+        if rows is None:
+            found = self.index[column].get(key, ())
+            rows = self.arrays[column, key] = np.fromiter(sorted(found), dtype=np.int64, count=len(found))
+
+        return rows
+
+    def select(self, filters: dict, min_rating: float = None, max_rating: float = None) -> np.ndarray:
+        """Rows of the users matching every filter, from the indexes
+
+        Args:
+            filters (dict): category column or total_stars -> value, e.g. {'country': 'India', 'total_stars': 4}
+            min_rating (float): lowest rating, included
+            max_rating (float): highest rating, included
+
+        Returns:
+            np.ndarray: sorted rows
+        """
+        with self.lock:
+            selections = []
+
+            for column, value in filters.items():
+                key = int(value) if column == 'total_stars' else self.lookup[column].get(category(column, value))
+                selections.append(self.indexed(column, key))
+
+            if min_rating is not None or max_rating is not None:
+                low = -np.inf if min_rating is None else min_rating
+                high = np.inf if max_rating is None else max_rating
+                buckets = [bucket for bucket in self.index['rating_bucket']
+                           if low < (bucket + 1) * ANALYTICS_RATING_BUCKET and bucket * ANALYTICS_RATING_BUCKET <= high]
+                rows = np.sort(np.concatenate([self.indexed('rating_bucket', bucket) for bucket in buckets] or
+                                              [np.empty(0, dtype=np.int64)]))
+                # the first and last bucket can hold ratings outside the range
+                ratings = self.numbers['rating'][rows]
+                selections.append(rows[(ratings >= low) & (ratings <= high)])
+
+            if not selections:
+                return np.arange(self.size)
+
+            # smallest first, every intersection is at most as large as it
+            selections.sort(key=len)
+            rows = selections[0]
+
+            for other in selections[1:]:
+                rows = np.intersect1d(rows, other, assume_unique=True)
+
+            return rows
+
+    def leaderboard(self, rows: np.ndarray, sort: str = 'rating', offset: int = 0, limit: int = 100) -> list:
+        """One page of the users of rows, best first
+
+        Args:
+            rows (np.ndarray): users to rank, see select
+            sort (str): column of SORTS, ties share a rank (1, 2, 2, 4)
+            offset (int): users skipped
+            limit (int): users returned
+
+        Returns:
+            list: dicts with rank, username, the category and number columns
+        """
+        with self.lock:
+            # ascending key, users without a value (NaN) last
+            key = self.numbers[sort][rows]
+            key = np.where(np.isnan(key), np.inf, -key if SORTS[sort] else key)
+            order = np.argsort(key, kind='stable')
+            sorted_key = key[order]
+            page = slice(offset, offset + limit)
+            ranks = np.searchsorted(sorted_key, sorted_key[page], side='left') + 1
+            users = []
+
+            for rank, value, row in zip(ranks.tolist(), sorted_key[page].tolist(), rows[order[page]].tolist()):
+                user = {'rank': rank if value != np.inf else None, 'username': self.usernames[row]}
+
+                for column, codes in self.codes.items():
+                    user[column] = self.names[column][codes[row]] or None
+
+                for column, values in self.numbers.items():
+                    user[column] = None if np.isnan(values[row]) else int(values[row])
+
+                users.append(user)
+
+            return users
+
+    def distribution(self, rows: np.ndarray, column: str = 'rating', bucket: int = 100) -> dict:
+        """Percentiles and histogram of a number column over rows
+
+        Returns:
+            dict: `percentiles` (PERCENTILES -> value) and `histogram` (bucket lower bound -> users)
+        """
+        with self.lock:
+            values = self.numbers[column][rows]
+
+        values = values[~np.isnan(values)]
+
+        if not values.size:
+            return {'percentiles': {}, 'histogram': {}}
+
+        percentiles = np.percentile(values, PERCENTILES)
+        lowest = int(values.min() // bucket)
+        counts = np.bincount((values // bucket).astype(np.int64) - lowest)
+
+        return {
+            'percentiles': {
+                str(percentile): round(value, 1) for percentile, value in zip(PERCENTILES, percentiles.tolist())
+            },
+            'histogram': {
+                str((lowest + index) * bucket): count for index, count in enumerate(counts.tolist()) if count
+            }
+        }
+
+    def group_by(self, rows: np.ndarray, column: str, offset: int = 0, limit: int = 100,
+                 min_users: int = 1) -> list:
+        """Users, mean and best rating per category value of the users of rows, best mean rating first
+
+        Args:
+            column (str): category column, e.g. institution
+            min_users (int): groups with fewer users are left out
+        """
+        with self.lock:
+            names = np.array(self.names[column], dtype=object)
+            codes = self.codes[column][rows]
+            ratings = self.numbers['rating'][rows]
+
+        rated = ~np.isnan(ratings)
+        counts = np.bincount(codes, minlength=len(names))
+        rated_counts = np.bincount(codes[rated], minlength=len(names))
+        sums = np.bincount(codes[rated], weights=ratings[rated], minlength=len(names))
+        best = np.full(len(names), -np.inf)
+        np.maximum.at(best, codes[rated], ratings[rated])
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / rated_counts
+
+        groups = np.flatnonzero((counts >= max(1, min_users)) & (names != ''))
+        groups = groups[np.argsort(np.where(np.isnan(means[groups]), np.inf, -means[groups]), kind='stable')]
+
+        return [
+            {
+                column: names[group],
+                'users': int(counts[group]),
+                'mean_rating': None if np.isnan(means[group]) else round(float(means[group]), 1),
+                'max_rating': None if best[group] == -np.inf else int(best[group])
+            }
+            for group in groups[offset:offset + limit].tolist()
+        ]
+
+
+table = None
+loaded = None
+load_lock = threading.Lock()
+
+
+def user_table() -> UserTable:
+    """Table of the cached stats, loaded on first use and reloaded after ANALYTICS_TTL"""
+    global table, loaded
+
+    if table is not None and time.monotonic() - loaded < ANALYTICS_TTL:
+        return table
+
+    # the first load waits, later ones are done by one request while the others use the old table
+    if not load_lock.acquire(blocking=table is None):
+        return table
+
+    try:
+        if table is None or time.monotonic() - loaded >= ANALYTICS_TTL:
+            table = UserTable(load_stats())
+            loaded = time.monotonic()
+
+        return table
+
+    finally:
+        load_lock.release()
+
+
+def record_stats(username: str, result):
+    """ResultCache listener of the stats section, keeps the loaded table up to date between reloads"""
+    if table is not None and isinstance(result, UserStats):
+        table.update(result.to_dict())
+
+
+result_cache.on_put('stats', record_stats)
@@ -7,4 +7,8 @@ from API import index
 app = index()
 
 if __name__ == "__main__":
+    # the development server can crawl a watchlist itself, with several workers run crawler.py on its own
+    from crawler import start_from_env
+
+    start_from_env()
     app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,150 @@
+import json
+import math
+import os
+import re
+from functools import lru_cache
+from urllib.parse import parse_qs, urlsplit
+from benchmarks.fixtures.generate import COUNTRIES, INSTITUTIONS, PROFILES
+
+FIXTURES_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILES_DIR = os.path.join(FIXTURES_DIR, 'profiles')
+RANKINGS_DIR = os.path.join(FIXTURES_DIR, 'rankings')
+
+PROFILE_PATH = re.compile(r'^/users/([^/?]+)$')
+RANKINGS_PATH = re.compile(r'^/api/rankings/([^/?]+)$')
+
+# rankings requests without a search get a synthetic leaderboard of this many users, the profile fixtures included
+RANKINGS_PARTICIPANTS = 2500
+
+
+def profile_names() -> list:
+    """Names of all generated profile pages, usable as usernames against the fixture transport"""
+    return sorted(name[:-5] for name in os.listdir(PROFILES_DIR) if name.endswith('.html'))
+
+
+@lru_cache(maxsize=None)
+def load_profile(name: str) -> bytes:
+    """Raw HTML of a generated profile page, unknown users get the invalid user page like on codechef.com"""
+    path = os.path.join(PROFILES_DIR, f'{name}.html')
+
+    if not os.path.exists(path):
+        path = os.path.join(PROFILES_DIR, 'invalid_user.html')
+
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+@lru_cache(maxsize=None)
+def load_rankings(contest: str) -> bytes:
+    """Raw JSON of a generated rankings payload, contests without one reuse the default payload"""
+    path = os.path.join(RANKINGS_DIR, f'{contest}.json')
+
+    if os.path.exists(path):
+        with open(path, 'rb') as file:
+            return file.read()
+
+    with open(os.path.join(RANKINGS_DIR, '_default.json'), encoding='utf-8') as file:
+        payload = json.load(file)
+
+    payload['contest_info']['contest_code'] = contest
+    payload['contest_name'] = payload['contest_name'].replace('DEFAULT', contest)
+    return json.dumps(payload).encode()
+
+
+@lru_cache(maxsize=None)
+def leaderboard(contest: str) -> tuple:
+    """Rows of the whole synthetic leaderboard of a contest, by rank"""
+    template = json.loads(load_rankings(contest))['list'][0]
+    others = RANKINGS_PARTICIPANTS - len(PROFILES)
+    handles = sorted(PROFILES) + [f'participant_{number:05d}' for number in range(others)]
+    rows = []
+
+    for rank, handle in enumerate(handles, 1):
+        row = dict(template, rank=rank, user_handle=handle)
+        row['country'] = COUNTRIES[rank % len(COUNTRIES)]
+        row['institution'] = INSTITUTIONS[rank % len(INSTITUTIONS)]
+        rows.append(row)
+
+    return tuple(rows)
+
+
+def rankings_page(contest: str, query: str) -> bytes:
+    """Rankings payload for a query string, a page of the synthetic leaderboard unless it searches one user
+
+    Supports page, itemsPerPage and filterBy=<Institution|Country>=<value>, like the codechef rankings api.
+    """
+    params = parse_qs(query)
+
+    if 'search' in params:
+        return load_rankings(contest)
+
+    rows = leaderboard(contest)
+
+    if 'filterBy' in params:
+        field, _, value = params['filterBy'][0].partition('=')
+        rows = [row for row in rows if row.get(field.lower()) == value]
+
+    size = int(params.get('itemsPerPage', ['100'])[0])
+    page = int(params.get('page', ['1'])[0])
+    payload = json.loads(load_rankings(contest))
+    payload['list'] = list(rows[(page - 1) * size:page * size])
+    payload['availablePages'] = math.ceil(len(rows) / size)
+    payload['totalItems'] = len(rows)
+    return json.dumps(payload).encode()
+
+
+def fixture_body(url: str):
+    """Fixture content for a codechef.com url
+
+    Args:
+        url (str): profile or rankings url
+
+    Returns:
+        tuple or None: (content type, body) or None if the url is not part of the corpus
+    """
+    parts = urlsplit(url)
+    path = parts.path
+    match = PROFILE_PATH.match(path)
+
+    if match:
+        return 'text/html; charset=utf-8', load_profile(match.group(1))
+
+    match = RANKINGS_PATH.match(path)
+
+    if match:
+        return 'application/json', rankings_page(match.group(1), parts.query)
+
+    return None
+
+
+class FixtureResponse:
+    """Just enough of requests.Response for get_response"""
+
+    def __init__(self, url: str, status_code: int, content: bytes, content_type: str):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = {'content-type': content_type, 'content-length': str(len(content))}
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def fixture_transport(url: str, **kwargs) -> FixtureResponse:
+    """Drop-in replacement for requests.get that serves the fixture corpus"""
+    found = fixture_body(url)
+
+    if found is None:
+        return FixtureResponse(url, 404, b'Not Found', 'text/plain')
+
+    content_type, body = found
+    return FixtureResponse(url, 200, body, content_type)
+
+
+def fixture_session_get(session, url: str, **kwargs) -> FixtureResponse:
+    """Drop-in replacement for requests.Session.get that serves the fixture corpus"""
+    return fixture_transport(url, **kwargs)
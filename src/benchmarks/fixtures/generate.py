@@ -0,0 +1,211 @@
+# ===================================================================
+# =============== Offline fixture corpus generator ==================
+# ===================================================================
+#
+# Rebuilds the profile pages and rankings payloads under this directory. They
+# are synthetic, not recorded: the markup mirrors only the parts of a
+# codechef.com profile page the scrapers read, so the pages are much smaller
+# and simpler than real ones. The output is deterministic and never needs
+# network access.
+#
+#   python -m benchmarks.fixtures.generate
+
+import json
+import os
+import random
+
+FIXTURES_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILES_DIR = os.path.join(FIXTURES_DIR, 'profiles')
+RANKINGS_DIR = os.path.join(FIXTURES_DIR, 'rankings')
+
+PROFILES = {
+    # fixture name: (username, stars, rating, contests, fully solved, pro plan)
+    'small_user': ('small_user', 1, 1279, 3, 25, None),
+    'medium_user': ('medium_user', 3, 1712, 60, 600, None),
+    'large_user': ('large_user', 6, 2481, 420, 3000, None),
+    'pro_user': ('pro_user', 4, 1906, 12, 180, 'Pro Annual Plan'),
+}
+
+CONTEST_PREFIXES = ['START', 'COOK', 'LTIME', 'JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT',
+                    'NOV', 'DEC']
+INSTITUTIONS = ['Graphic Era University', 'IIT Delhi', 'NIT Trichy', 'BITS Pilani', 'IIIT Hyderabad']
+COUNTRIES = ['India', 'Bangladesh', 'Nepal', 'Egypt', 'Vietnam']
+
+
+def contest_codes(count: int, rnd: random.Random) -> list:
+    """Unique, plausible contest codes"""
+    codes = []
+    seen = set()
+
+    while len(codes) < count:
+        code = f'{rnd.choice(CONTEST_PREFIXES)}{rnd.randint(10, 199)}{rnd.choice("ABCD")}'
+        if code not in seen:
+            seen.add(code)
+            codes.append(code)
+
+    return codes
+
+
+def problem_codes(count: int, rnd: random.Random) -> list:
+    """Random upper case problem codes"""
+    alphabet = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    return [''.join(rnd.choice(alphabet) for _ in range(rnd.randint(4, 9))) + str(i) for i in range(count)]
+
+
+def profile_page(username: str, stars: int, rating: int, contests: list, solved: list, pro_plan: str,
+                 rnd: random.Random) -> str:
+    """Render a profile page with the same structure as codechef.com/users/<username>"""
+    if pro_plan is None:
+        plan = 'No Active Plan. <a href="/pricing?utm_source=profile-plan">Get Pro</a>'
+    else:
+        plan = f'{pro_plan}. Valid till 12 Dec 2026 <a href="/pricing?utm_source=profile-plan">Manage</a>'
+
+    side_nav = f"""
+      <ul class="side-nav">
+        <li><label>Username:</label><span class="m-username--link"><span class="rating">{stars}&#9733;</span>{username}</span></li>
+        <li><label>Country:</label><span class="user-country-name">  {rnd.choice(COUNTRIES)}  </span></li>
+        <li><label>Student/Professional:</label><span>Student</span></li>
+        <li><label>Institution:</label><span>{rnd.choice(INSTITUTIONS)}</span></li>
+        <li><label>Link:</label><span><a href="https://{username}.github.io/" target="_blank">{username}.github.io</a></span></li>
+        <li><label>Teams List:</label><span><a href="/users/{username}/teams">View Teams</a></span></li>
+        <li><label>Discuss Profile:</label><span><a href="https://discuss.codechef.com/u/{username}">View</a></span></li>
+        <li><label>CodeChef Pro Plan:</label><span>
+            {plan}
+        </span></li>
+      </ul>"""
+
+    badges = """
+      <div class="widget-badges">
+        <div class="badge"><p class="badge__title">1v1 Challenge Badge - Bronze Badge</p></div>
+        <div class="badge"><p class="badge__title">Daily Streak - Gold Badge</p></div>
+        <div class="badge"><p class="badge__title">Problem Solver - Silver Badge</p></div>
+      </div>"""
+
+    # every solved problem is listed once, spread over practice and the contests, so the page shows as many
+    # links as its "Fully Solved" count
+    groups = len(contests) + 1
+    chunks = [solved[len(solved) * i // groups:len(solved) * (i + 1) // groups] for i in range(groups)]
+    practice = chunks[0]
+
+    def anchors(codes):
+        return ', '.join(f'<a href="/status/{code},{username}" target="_blank">{code}</a>' for code in codes)
+
+    paragraphs = [f'<p><strong>Practice(extcontest):</strong><span style="font-size: 12px">{anchors(practice)}</span></p>']
+    for index, contest in enumerate(contests):
+        codes = chunks[index + 1]
+        paragraphs.append(f'<p><strong>{contest}:</strong><span style="font-size: 12px">{anchors(codes)}</span></p>')
+
+    rating_section = f"""
+      <div class="rating-header text-center">
+        <div class="rating-number">{rating}?</div>
+        <div>(Div {max(1, 5 - stars // 2)})</div>
+        <small>(Highest Rating {rating + rnd.randint(0, 200)})</small>
+      </div>
+      <div class="rating-ranks">
+        <ul class="inline-list">
+          <li><a href="/ratings/all"><strong>{rnd.randint(100, 99999)}</strong></a> Global Rank</li>
+          <li><a href="/ratings/all?filterBy=Country"><strong>{rnd.randint(10, 90000)}</strong></a> Country Rank</li>
+        </ul>
+      </div>
+      <section class="rating-data-section problems-solved">
+        <h2>Problems Solved</h2>
+        <div class="content">
+          <h5>Fully Solved ({len(solved)})</h5>
+          <article>
+            {''.join(paragraphs)}
+          </article>
+          <h5>Partially Solved ({rnd.randint(0, 5)})</h5>
+          <article></article>
+        </div>
+      </section>"""
+
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="utf-8"><title>{username} | CodeChef User Profile | CodeChef</title></head>
+<body>
+  <header><nav class="main-nav"><a href="/">Home</a><a href="/practice">Practice</a><a href="/contests">Compete</a></nav></header>
+  <main class="content-wrapper">
+    <div class="user-details-container plr10">{side_nav}
+    </div>{badges}
+    <div class="rating-graphs">{rating_section}
+    </div>
+  </main>
+  <footer><p>&copy; 2009-2026 CodeChef</p></footer>
+</body>
+</html>
+"""
+
+
+def invalid_page() -> str:
+    """Page served by codechef.com for a username that does not exist"""
+    return """<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="utf-8"><title>CodeChef | Competitive Programming</title></head>
+<body>
+  <header><nav class="main-nav"><a href="/">Home</a></nav></header>
+  <main class="content-wrapper"><h1>Practice and compete in coding challenges</h1></main>
+</body>
+</html>
+"""
+
+
+def rankings_payload(contest: str, username: str, rnd: random.Random) -> dict:
+    """Response of /api/rankings/<contest>?search=<username>"""
+    problems = problem_codes(rnd.randint(4, 8), rnd)
+    solved = problems[:rnd.randint(1, len(problems))]
+
+    return {
+        'status': 'success',
+        'contest_info': {'contest_code': contest, 'is_rating_contest': True, 'team_contest': False},
+        'contest_name': f'CodeChef {contest} Division 4',
+        'list': [{
+            'rank': rnd.randint(1, 25000),
+            'user_handle': username,
+            'score': float(100 * len(solved)),
+            'total_time': f'{rnd.randint(0, 2)}:{rnd.randint(10, 59)}:{rnd.randint(10, 59)}',
+            'penalty': rnd.randint(0, 40),
+            'country': rnd.choice(COUNTRIES),
+            'institution': rnd.choice(INSTITUTIONS),
+            'rating': rnd.randint(900, 2600),
+            'problems_status': {
+                code: {'score': 100, 'penalty': rnd.randint(0, 3), 'time': rnd.randint(60, 9000)}
+                for code in solved
+            },
+        }],
+        'problems': [
+            {'code': code, 'name': code.title(), 'successful_submissions': rnd.randint(10, 20000),
+             'accuracy': round(rnd.uniform(5, 90), 2)}
+            for code in problems
+        ],
+        'availablePages': 1,
+        'totalItems': 1,
+    }
+
+
+def main():
+    rnd = random.Random(20221016)
+    os.makedirs(PROFILES_DIR, exist_ok=True)
+    os.makedirs(RANKINGS_DIR, exist_ok=True)
+
+    for name, (username, stars, rating, contest_count, solved_count, pro_plan) in PROFILES.items():
+        contests = contest_codes(contest_count, rnd)
+        solved = problem_codes(solved_count, rnd)
+
+        with open(os.path.join(PROFILES_DIR, f'{name}.html'), 'w', encoding='utf-8') as file:
+            file.write(profile_page(username, stars, rating, contests, solved, pro_plan, rnd))
+
+        # one rankings payload per contest for the small users, the large ones share the default
+        if contest_count <= 12:
+            for contest in contests:
+                with open(os.path.join(RANKINGS_DIR, f'{contest}.json'), 'w', encoding='utf-8') as file:
+                    json.dump(rankings_payload(contest, username, rnd), file, indent=1)
+
+    with open(os.path.join(PROFILES_DIR, 'invalid_user.html'), 'w', encoding='utf-8') as file:
+        file.write(invalid_page())
+
+    with open(os.path.join(RANKINGS_DIR, '_default.json'), 'w', encoding='utf-8') as file:
+        json.dump(rankings_payload('DEFAULT', 'default_user', rnd), file, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# ===================================================================
+# ===================== End-to-End Load Harness =====================
+# ===================================================================
+#
+# Starts the mock upstream and the API in-process, drives the Flask endpoints under every upstream
+# profile and reports latency percentiles and throughput.
+#
+#   python -m benchmarks.load_test [--requests 200] [--concurrency 8] [--profiles typical flaky]
+
+import argparse
+import logging
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.mock_codechef import PROFILES, start_mock_server
+
+ENDPOINTS = ['/user-stats', '/solved', '/contest-details']
+USERNAMES = ['small_user', 'medium_user', 'pro_user', 'invalid_user']
+
+
+def start_api(upstream_url: str):
+    """Import the API pointed at the mock upstream and serve it on a free port"""
+    os.environ['CODECHEF_BASE_URL'] = upstream_url
+    os.environ.setdefault('TRACING_EXPORTER', 'none')
+    os.environ.setdefault('MIN_TIME_SLEEP', '0')
+    os.environ.setdefault('MAX_TIME_SLEEP', '1')
+    # every request should reach upstream, cached results would make later profiles measure cache hits
+    os.environ.setdefault('RESULT_CACHE_TTL', '0')
+
+    # the scrapers read the upstream url at import time
+    from werkzeug.serving import make_server
+    from API import index
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, index(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_profile(api_url: str, total: int, concurrency: int) -> dict:
+    """Fire `total` requests round-robin over endpoints and users, `concurrency` at a time"""
+    import requests
+
+    session = requests.Session()
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def one(i):
+        endpoint = ENDPOINTS[i % len(ENDPOINTS)]
+        username = USERNAMES[(i // len(ENDPOINTS)) % len(USERNAMES)]
+        start = time.perf_counter()
+        status = session.post(api_url + endpoint, headers={'username': username}, timeout=300).status_code
+        elapsed = time.perf_counter() - start
+
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(one, range(total)))
+    wall = time.perf_counter() - start
+
+    cuts = statistics.quantiles(latencies, n=100)
+    return {
+        'p50_ms': cuts[49] * 1000,
+        'p95_ms': cuts[94] * 1000,
+        'p99_ms': cuts[98] * 1000,
+        'rps': total / wall,
+        'statuses': statuses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the API against the mock upstream')
+    parser.add_argument('--requests', type=int, default=200, help='requests per upstream profile')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--profiles', nargs='+', choices=sorted(PROFILES), default=list(PROFILES))
+    args = parser.parse_args()
+
+    upstream = start_mock_server()
+    api = start_api(upstream.url)
+    api_url = f'http://127.0.0.1:{api.server_port}'
+
+    print(f'{"profile":<12}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"req/s":>10}  api statuses / upstream statuses')
+
+    for name in args.profiles:
+        upstream.set_profile(PROFILES[name])
+        result = run_profile(api_url, args.requests, args.concurrency)
+        print(f'{name:<12}{result["p50_ms"]:>10.1f}{result["p95_ms"]:>10.1f}{result["p99_ms"]:>10.1f}'
+              f'{result["rps"]:>10.1f}  {result["statuses"]} / {upstream.status_counts}')
+
+    api.shutdown()
+    upstream.shutdown()
+
+
+if __name__ == "__main__":
+    main()
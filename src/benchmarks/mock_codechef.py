@@ -0,0 +1,169 @@
+# ===================================================================
+# ================== Mock CodeChef Upstream Server ==================
+# ===================================================================
+#
+# Stand-in for www.codechef.com serving /users/<name> and /api/rankings/<contest> from the fixture corpus.
+# Point the API at it with
+#
+#   CODECHEF_BASE_URL=http://127.0.0.1:8081 python app.py
+#   python -m benchmarks.mock_codechef --port 8081 --profile flaky
+
+import argparse
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from benchmarks.fixtures import fixture_body
+
+
+@dataclass
+class UpstreamProfile:
+    """Behaviour of the mock upstream
+
+    latency_ms/jitter_ms delay every response, error_rate is the share of requests answered with a 503,
+    every `burst_every` requests the next `burst_length` requests get a 429, and throttle_rps answers
+    everything above that request rate with a 429 (0 disables the throttle).
+    """
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    burst_every: int = 0
+    burst_length: int = 0
+    throttle_rps: float = 0.0
+
+
+PROFILES = {
+    'ideal': UpstreamProfile(),
+    'typical': UpstreamProfile(latency_ms=120, jitter_ms=60),
+    'slow': UpstreamProfile(latency_ms=600, jitter_ms=300),
+    'flaky': UpstreamProfile(latency_ms=120, jitter_ms=60, error_rate=0.05),
+    'bursty': UpstreamProfile(latency_ms=120, jitter_ms=60, burst_every=200, burst_length=20),
+    'throttled': UpstreamProfile(latency_ms=120, jitter_ms=60, throttle_rps=20),
+}
+
+
+class MockCodechefServer(ThreadingHTTPServer):
+    """Threaded HTTP server whose behaviour can be switched between profiles while it runs"""
+    daemon_threads = True
+
+    def __init__(self, address: tuple, profile: UpstreamProfile):
+        super().__init__(address, MockCodechefHandler)
+        self.profile = profile
+        self.lock = threading.Lock()
+        self.requests_seen = 0
+        self.burst_left = 0
+        self.tokens = 0.0
+        self.last_refill = time.monotonic()
+        self.status_counts = {}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def set_profile(self, profile: UpstreamProfile):
+        with self.lock:
+            self.profile = profile
+            self.requests_seen = 0
+            self.burst_left = 0
+            self.tokens = profile.throttle_rps
+            self.last_refill = time.monotonic()
+            self.status_counts = {}
+
+    def rejection_status(self):
+        """Status code forced by the current profile for the next request, or None to serve it normally"""
+        profile = self.profile
+
+        with self.lock:
+            self.requests_seen += 1
+
+            if profile.burst_every and self.requests_seen % profile.burst_every == 0:
+                self.burst_left = profile.burst_length
+
+            if self.burst_left > 0:
+                self.burst_left -= 1
+                return 429
+
+            if profile.throttle_rps:
+                now = time.monotonic()
+                self.tokens = min(profile.throttle_rps, self.tokens + (now - self.last_refill) * profile.throttle_rps)
+                self.last_refill = now
+
+                if self.tokens < 1:
+                    return 429
+                self.tokens -= 1
+
+        if profile.error_rate and random.random() < profile.error_rate:
+            return 503
+
+        return None
+
+    def count(self, status: int):
+        with self.lock:
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+
+class MockCodechefHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        profile = self.server.profile
+        delay = profile.latency_ms + random.uniform(-profile.jitter_ms, profile.jitter_ms)
+
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+        status = self.server.rejection_status()
+        found = fixture_body(self.path)
+
+        if status is None and found is None:
+            status = 404
+
+        if status is None:
+            content_type, body = found
+            status = 200
+        else:
+            content_type, body = 'text/plain', f'mock upstream status {status}'.encode()
+
+        self.server.count(status)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+
+        if status == 429:
+            self.send_header('Retry-After', '1')
+
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # keep load test output readable
+        pass
+
+
+def start_mock_server(profile: UpstreamProfile = None, host: str = '127.0.0.1', port: int = 0) -> MockCodechefServer:
+    """Start the mock upstream in a background thread, port 0 picks a free port"""
+    server = MockCodechefServer((host, port), profile or PROFILES['ideal'])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the fixture corpus as a stand-in for www.codechef.com')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='typical')
+    args = parser.parse_args()
+
+    server = MockCodechefServer((args.host, args.port), PROFILES[args.profile])
+    print(f'mock codechef ({args.profile}) listening on {server.url}')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# ===================================================================
+# ===================== Offline Parser Benchmark ====================
+# ===================================================================
+#
+# Times the scrapers against the generated fixture corpus, no request leaves the machine. The fixture pages
+# are synthetic and much smaller than real codechef.com pages, compare timings between changes only, they do
+# not predict production parse times.
+#
+#   python -m benchmarks.parser_benchmark [--rounds 20] [--profiles small_user large_user]
+
+import argparse
+import gc
+import os
+import time
+import tracemalloc
+from unittest import mock
+
+# measure the scrapers, not the span exporter
+os.environ.setdefault('TRACING_EXPORTER', 'none')
+
+from benchmarks.fixtures import fixture_session_get, profile_names
+from helper_functions import BASE_URL, get_response
+from scraping_code import get_all_solved_links, get_user_stats, multiple_threads_scraping
+from scraping_code.codechef_core_api_endpoints import contest_endpoint
+
+DEFAULT_ROUNDS = 20
+RANKINGS_CONTESTS = ['_default']
+
+
+def measure(func, args: tuple, rounds: int) -> dict:
+    """Run func(*args) `rounds` times
+
+    Args:
+        func (callable): function to benchmark
+        args (tuple): arguments for func
+        rounds (int): number of timed calls
+
+    Returns:
+        dict: ops/sec, mean time per call in ms and peak traced memory of a single call in KiB
+    """
+    # warm up (fixtures are cached after the first read), then measure memory of one call on its own
+    # because tracemalloc would slow the timed loop down
+    func(*args)
+    gc.collect()
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(*args)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'ops_sec': rounds / elapsed,
+        'mean_ms': elapsed / rounds * 1000,
+        'peak_kib': peak / 1024,
+    }
+
+
+def legacy_solved_links(username: str) -> list:
+    """get_all_solved_links as it was before returning strings: bs4 Tags keeping the whole page alive"""
+    soup = get_response(f'{BASE_URL}/users/{username}')
+    return soup.find('section', {'class': 'rating-data-section problems-solved'}).find_all('a')
+
+
+def contest_history_as_dicts(username: str) -> dict:
+    """multiple_threads_scraping result in the nested dict form results were kept in before the models"""
+    return multiple_threads_scraping(username).to_dict()
+
+
+def retained_memory(func, args: tuple) -> tuple:
+    """Peak traced memory during func(*args) and memory still held by its result, both in KiB"""
+    gc.collect()
+    tracemalloc.start()
+    result = func(*args)
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    return peak / 1024, retained / 1024
+
+
+def benchmarks(profiles: list) -> list:
+    """(name, function, args) for every scraper and fixture combination"""
+    cases = []
+
+    for profile in profiles:
+        cases.append((f'get_user_stats[{profile}]', get_user_stats, (profile,)))
+        cases.append((f'get_all_solved_links[{profile}]', get_all_solved_links, (profile,)))
+        cases.append((f'multiple_threads_scraping[{profile}]', multiple_threads_scraping, (profile,)))
+
+    for contest in RANKINGS_CONTESTS:
+        cases.append((f'contest_endpoint[{contest}]', contest_endpoint, (contest, 'default_user')))
+
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the scrapers against the offline fixture corpus')
+    parser.add_argument('--rounds', type=int, default=DEFAULT_ROUNDS, help='timed calls per benchmark')
+    parser.add_argument('--profiles', nargs='+', default=profile_names(), help='fixture profiles to run')
+    args = parser.parse_args()
+
+    print(f'{"benchmark":<45}{"ops/sec":>12}{"mean ms":>12}{"peak KiB":>12}')
+
+    with mock.patch('helper_functions.requests.Session.get', fixture_session_get):
+        for name, func, func_args in benchmarks(args.profiles):
+            result = measure(func, func_args, args.rounds)
+            print(f'{name:<45}{result["ops_sec"]:>12.1f}{result["mean_ms"]:>12.2f}{result["peak_kib"]:>12.1f}')
+
+        print(f'\n{"solved links memory (KiB)":<45}{"peak":>12}{"retained":>12}')
+        for profile in args.profiles:
+            if profile == 'invalid_user':
+                continue
+
+            for name, func in (('bs4 tags', legacy_solved_links), ('strings', get_all_solved_links)):
+                peak, retained = retained_memory(func, (profile,))
+                print(f'{f"{name}[{profile}]":<45}{peak:>12.1f}{retained:>12.1f}')
+
+        print(f'\n{"contest results memory (KiB)":<45}{"peak":>12}{"retained":>12}')
+        for profile in args.profiles:
+            if profile == 'invalid_user':
+                continue
+
+            for name, func in (('dicts', contest_history_as_dicts), ('models', multiple_threads_scraping)):
+                peak, retained = retained_memory(func, (profile,))
+                print(f'{f"{name}[{profile}]":<45}{peak:>12.1f}{retained:>12.1f}')
+
+
+if __name__ == "__main__":
+    main()
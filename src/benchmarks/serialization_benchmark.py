@@ -0,0 +1,83 @@
+# ===================================================================
+# ==================== Response Serialization Benchmark =============
+# ===================================================================
+#
+# Encodes scraped fixture results with every installed JSON backend, next to what jsonify used to do
+# (to_dict + stdlib json with sorted keys), then compresses the encoded bodies with every installed content
+# coding at the per request and the cached level.
+#
+#   python -m benchmarks.serialization_benchmark [--rounds 50] [--profile large_user]
+
+import argparse
+import json
+import os
+import time
+from unittest import mock
+
+os.environ.setdefault('TRACING_EXPORTER', 'none')
+
+from API import serialization
+from API.compression import COMPRESSORS, compress
+from benchmarks.fixtures import fixture_session_get
+from scraping_code import get_user_stats, multiple_threads_scraping
+
+
+def encoders() -> dict:
+    """name -> callable(result) -> bytes for every backend installed here"""
+    found = {
+        'jsonify (stdlib, sorted)': lambda result: json.dumps(result.to_dict(), sort_keys=True).encode(),
+        'json': serialization._stdlib_dumps,
+    }
+
+    if serialization.orjson is not None:
+        found['orjson'] = lambda result: serialization.orjson.dumps(
+            result, default=serialization.to_builtin, option=serialization.orjson.OPT_PASSTHROUGH_DATACLASS)
+
+    if serialization.msgspec is not None:
+        found['msgspec'] = serialization._msgspec_dumps()
+
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark JSON encoding of scraped results')
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--profile', default='large_user', help='fixture profile to encode')
+    args = parser.parse_args()
+
+    with mock.patch('helper_functions.requests.Session.get', fixture_session_get):
+        results = {'stats': get_user_stats(args.profile), 'contests': multiple_threads_scraping(args.profile)}
+
+    print(f'{"encoder":<28}{"result":<12}{"ops/sec":>12}{"mean ms":>12}{"KiB":>10}')
+
+    for name, encode in encoders().items():
+        for section, result in results.items():
+            body = encode(result)
+            start = time.perf_counter()
+            for _ in range(args.rounds):
+                encode(result)
+            elapsed = time.perf_counter() - start
+
+            print(f'{name:<28}{section:<12}{args.rounds / elapsed:>12.1f}{elapsed / args.rounds * 1000:>12.3f}'
+                  f'{len(body) / 1024:>10.1f}')
+
+    print(f'\n{"encoding":<28}{"result":<12}{"ops/sec":>12}{"mean ms":>12}{"KiB":>10}')
+
+    for encoding in COMPRESSORS:
+        for cached in (False, True):
+            name = f'{encoding} ({"cached" if cached else "per request"})'
+
+            for section, result in results.items():
+                body = serialization.dumps(result)
+                compressed = compress(body, encoding, cached)
+                start = time.perf_counter()
+                for _ in range(args.rounds):
+                    compress(body, encoding, cached)
+                elapsed = time.perf_counter() - start
+
+                print(f'{name:<28}{section:<12}{args.rounds / elapsed:>12.1f}'
+                      f'{elapsed / args.rounds * 1000:>12.3f}{len(compressed) / 1024:>10.1f}')
+
+
+if __name__ == "__main__":
+    main()
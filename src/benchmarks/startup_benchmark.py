@@ -0,0 +1,81 @@
+# ===================================================================
+# ===================== Worker Cold-Start Benchmark =================
+# ===================================================================
+#
+# Imports the API the way a fresh worker does, in a new interpreter each run, and reports the import
+# time (python -X importtime), wall time and peak RSS, plus the modules that dominate the import.
+#
+#   python -m benchmarks.startup_benchmark [--runs 5] [--module app]
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# prints the peak RSS of the child in KiB (ru_maxrss is KiB on Linux, bytes on macOS)
+CHILD = """
+import resource, sys
+import {module}
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(rss // 1024 if sys.platform == 'darwin' else rss)
+"""
+
+
+def parse_importtime(stderr: str) -> dict:
+    """module -> cumulative import time in microseconds, from the -X importtime output"""
+    cumulative = {}
+
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        cumulative[name.strip()] = int(cumulative_us)
+
+    return cumulative
+
+
+def cold_start(module: str) -> dict:
+    """Import `module` in a fresh interpreter"""
+    env = dict(os.environ, TRACING_EXPORTER='none')
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD.format(module=module)],
+                            cwd=SRC_DIR, env=env, capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - start
+    imports = parse_importtime(result.stderr)
+
+    return {
+        'wall_ms': wall * 1000,
+        'import_ms': imports.get(module, 0) / 1000,
+        'rss_kib': int(result.stdout.strip().splitlines()[-1]),
+        'imports': imports,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold-start import time and RSS of an API worker')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--module', default='app', help='module a worker imports on start')
+    parser.add_argument('--top', type=int, default=10, help='number of slowest top-level imports to list')
+    args = parser.parse_args()
+
+    runs = [cold_start(args.module) for _ in range(args.runs)]
+
+    print(f'{args.module}: median over {args.runs} runs')
+    print(f'  import   {statistics.median(run["import_ms"] for run in runs):8.1f} ms')
+    print(f'  wall     {statistics.median(run["wall_ms"] for run in runs):8.1f} ms (interpreter start included)')
+    print(f'  peak RSS {statistics.median(run["rss_kib"] for run in runs) / 1024:8.1f} MiB')
+
+    imports = runs[-1]['imports']
+    top_level = {name: us for name, us in imports.items() if '.' not in name and name != args.module}
+    print('  slowest imports:')
+    for name, us in sorted(top_level.items(), key=lambda item: -item[1])[:args.top]:
+        print(f'    {name:<30}{us / 1000:8.1f} ms')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,443 @@
+# ===================================================================
+# ======================= Watchlist Crawler =========================
+# ===================================================================
+#
+# Keeps the result cache warm for a roster of users, so API reads hit cached data instead of scraping on
+# demand. Every user has a refresh interval and a priority; overdue users are refreshed highest priority
+# first by a few worker threads. The pace adapts to upstream: it grows while refreshes succeed and halves
+# when too many of them fail (AIMD). Upstream requests still go through the rate limiter (UPSTREAM_RATE), shared
+# with the API workers through RESULT_CACHE_DIR.
+#
+# Refresh intervals adapt to every user: stats that changed since the last refresh (rating, solved problems,
+# contests) halve the interval, unchanged stats grow it by half, within CRAWLER_MIN_INTERVAL and
+# CRAWLER_MAX_INTERVAL. The interval of the watchlist is the starting point, and the upstream requests saved
+# against refreshing everyone at that fixed interval are reported.
+#
+# Run it next to the API with a RESULT_CACHE_DIR shared by both:
+#
+#   RESULT_CACHE_DIR=/var/cache/codechef python crawler.py watchlist.txt [--workers 4] [--once]
+#
+# The watchlist has one `username [interval seconds] [priority]` per line, `#` starts a comment.
+
+import argparse
+import heapq
+import itertools
+import json
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from API.cache import result_cache
+from API.endpoints import SECTIONS, status_of
+from API.serialization import dumps
+from metrics import CRAWLER_OVERDUE, CRAWLER_RATE, CRAWLER_REFRESHES, CRAWLER_REQUESTS_SAVED
+from scraping_code import contest_index
+from scraping_code.models import UserStats
+import timing
+
+WATCHLIST_FILE = os.environ.get('WATCHLIST_FILE')
+CRAWLER_WORKERS = int(os.environ.get('CRAWLER_WORKERS', 4))
+CRAWLER_SECTIONS = tuple(os.environ.get('CRAWLER_SECTIONS', 'stats,solved,contests').split(','))
+CRAWLER_INTERVAL = int(os.environ.get('CRAWLER_INTERVAL', 3600))  # in seconds, for users without one
+CRAWLER_RATE_START = float(os.environ.get('CRAWLER_RATE_START', 1))  # users per second
+CRAWLER_MIN_RATE = float(os.environ.get('CRAWLER_MIN_RATE', 0.05))  # users per second
+CRAWLER_MAX_RATE = float(os.environ.get('CRAWLER_MAX_RATE', 10))  # users per second
+CRAWLER_ADAPTIVE = os.environ.get('CRAWLER_ADAPTIVE', '1') != '0'  # 0 keeps the watchlist intervals
+CRAWLER_MIN_INTERVAL = int(os.environ.get('CRAWLER_MIN_INTERVAL', 900))  # in seconds
+CRAWLER_MAX_INTERVAL = int(os.environ.get('CRAWLER_MAX_INTERVAL', 7 * 24 * 3600))  # in seconds
+
+RATE_STEP = 0.25  # added to the rate after every successful window
+ERROR_WINDOW = 20  # refreshes the error rate is measured over
+MAX_ERROR_RATE = 0.1  # share of failed refreshes that halves the rate
+CACHE_TTL_FACTOR = 2  # crawled entries stay valid for this many refresh intervals
+SHRINK_FACTOR = 0.5  # interval factor after the stats changed
+GROW_FACTOR = 1.5  # interval factor after the stats stayed the same
+
+
+@dataclass
+class WatchedUser:
+    """User of the watchlist"""
+    __slots__ = ('username', 'interval', 'priority')
+
+    username: str
+    interval: int  # seconds between two refreshes
+    priority: int  # higher is refreshed first when several users are due
+
+
+def load_watchlist(path: str) -> list:
+    """Users of a watchlist file
+
+    Args:
+        path (str): file with one `username [interval seconds] [priority]` per line
+
+    Returns:
+        list: WatchedUser per line
+    """
+    users = []
+
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            fields = line.split('#', 1)[0].split()
+
+            if not fields:
+                continue
+
+            interval = int(fields[1]) if len(fields) > 1 else CRAWLER_INTERVAL
+            priority = int(fields[2]) if len(fields) > 2 else 0
+            users.append(WatchedUser(fields[0], interval, priority))
+
+    return users
+
+
+def stats_signature(result):
+    """The parts of a get_user_stats result that tell whether a user was active, None for failed scrapes"""
+    if not isinstance(result, UserStats):
+        return None
+
+    return result.rating, result.problem_fully_solved, result.contest_participate
+
+
+@dataclass
+class RefreshState:
+    """What the crawler learned about one user"""
+    __slots__ = ('interval', 'signature')
+
+    interval: float  # seconds until the next refresh
+    signature: tuple  # stats_signature of the last successful stats refresh
+
+
+class AdaptiveIntervals:
+    """Per user refresh intervals learned from how often the stats change
+
+    Args:
+        minimum (int): shortest interval in seconds
+        maximum (int): longest interval in seconds
+        enabled (bool): False keeps every user at their watchlist interval, the savings are still reported
+    """
+
+    def __init__(self, minimum: int = CRAWLER_MIN_INTERVAL, maximum: int = CRAWLER_MAX_INTERVAL,
+                 enabled: bool = CRAWLER_ADAPTIVE):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.states = {}
+        self.refreshes = 0
+        self.changes = 0
+        self.requests = 0
+        self.requests_saved = 0.0
+
+    def interval(self, user: WatchedUser) -> float:
+        state = self.states.get(user.username)
+        return user.interval if state is None else state.interval
+
+    def update(self, user: WatchedUser, signature: tuple, requests: int) -> float:
+        """Learn from a finished refresh of user
+
+        Args:
+            user (WatchedUser): refreshed user
+            signature (tuple): stats_signature of the refresh, None if the stats could not be scraped
+            requests (int): upstream requests the refresh made
+
+        Returns:
+            float: seconds until the next refresh
+        """
+        with self.lock:
+            self.refreshes += 1
+            self.requests += requests
+            state = self.states.get(user.username)
+
+            if state is None:
+                self.states[user.username] = RefreshState(user.interval, signature)
+                return user.interval
+
+            # a fixed schedule would have refreshed interval / watchlist interval times since the last refresh
+            self.requests_saved += (state.interval / user.interval - 1) * requests
+            CRAWLER_REQUESTS_SAVED.set(self.requests_saved)
+
+            if signature is None:
+                # nothing learned, try again at the same pace
+                return state.interval
+
+            changed = signature != state.signature
+            self.changes += changed
+            state.signature = signature
+
+            if self.enabled:
+                factor = SHRINK_FACTOR if changed else GROW_FACTOR
+                state.interval = min(self.maximum, max(self.minimum, state.interval * factor))
+
+            return state.interval
+
+    def report(self) -> dict:
+        """Refreshes made, how many found changed stats and the upstream requests saved"""
+        with self.lock:
+            intervals = [state.interval for state in self.states.values()]
+
+            return {
+                'users': len(self.states),
+                'refreshes': self.refreshes,
+                'changed': self.changes,
+                'upstream_requests': self.requests,
+                'upstream_requests_saved': round(self.requests_saved),
+                'interval_seconds': {
+                    'min': min(intervals, default=None),
+                    'median': statistics.median(intervals) if intervals else None,
+                    'max': max(intervals, default=None),
+                },
+            }
+
+
+class Pacer:
+    """Spaces out refresh starts at `rate` per second, additive increase while refreshes succeed and
+    multiplicative decrease when the error rate of the last ERROR_WINDOW refreshes passes MAX_ERROR_RATE
+
+    Args:
+        rate (float): initial refreshes per second
+        minimum (float): lowest rate
+        maximum (float): highest rate
+    """
+
+    def __init__(self, rate: float, minimum: float, maximum: float):
+        self.rate = rate
+        self.minimum = minimum
+        self.maximum = maximum
+        self.next_start = time.monotonic()
+        self.results = deque(maxlen=ERROR_WINDOW)
+        self.lock = threading.Lock()
+        CRAWLER_RATE.set(rate)
+
+    def wait(self):
+        """Sleep until the caller's turn to start a refresh"""
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + 1 / self.rate
+
+        time.sleep(start - now)
+
+    def report(self, ok: bool):
+        """Adjust the rate to the outcome of a refresh"""
+        with self.lock:
+            self.results.append(ok)
+
+            if len(self.results) < ERROR_WINDOW:
+                return
+
+            if self.results.count(False) / len(self.results) > MAX_ERROR_RATE:
+                self.rate = max(self.minimum, self.rate / 2)
+            else:
+                self.rate = min(self.maximum, self.rate + RATE_STEP)
+
+            # judge the next window on results at the new rate only
+            self.results.clear()
+            CRAWLER_RATE.set(self.rate)
+
+
+class Crawler:
+    """Refreshes the sections of every watched user into the result cache, each at its own interval
+
+    Args:
+        users (list): WatchedUser to keep fresh
+        workers (int): refresh threads
+        sections (tuple): sections of API.endpoints.SECTIONS to refresh
+        once (bool): refresh every user a single time and stop
+    """
+
+    def __init__(self, users: list, workers: int = CRAWLER_WORKERS, sections: tuple = CRAWLER_SECTIONS,
+                 once: bool = False):
+        self.workers = workers
+        self.sections = sections
+        self.once = once
+        self.pacer = Pacer(CRAWLER_RATE_START, CRAWLER_MIN_RATE, CRAWLER_MAX_RATE)
+        self.intervals = AdaptiveIntervals()
+        self.condition = threading.Condition()
+        self.sequence = itertools.count()  # tie breaker, users are not comparable
+        self.waiting = []  # heap of (due, seq, user)
+        self.ready = []  # heap of (-priority, due, seq, user), users past their due time
+        self.running = 0  # refreshes in progress
+        self.stopped = False
+        self.threads = []
+
+        now = time.monotonic()
+        for user in users:
+            self.schedule(user, now)
+
+    def schedule(self, user: WatchedUser, due: float):
+        with self.condition:
+            heapq.heappush(self.waiting, (due, next(self.sequence), user))
+            self.condition.notify()
+
+    def next_user(self):
+        """Highest priority user that is due, waits until one is; None once the crawler stops"""
+        with self.condition:
+            while not self.stopped:
+                now = time.monotonic()
+
+                while self.waiting and self.waiting[0][0] <= now:
+                    due, sequence, user = heapq.heappop(self.waiting)
+                    heapq.heappush(self.ready, (-user.priority, due, sequence, user))
+
+                CRAWLER_OVERDUE.set(len(self.ready))
+
+                if self.ready:
+                    self.running += 1
+                    return heapq.heappop(self.ready)[-1]
+
+                if self.once and not self.waiting and not self.running:
+                    self.stopped = True
+                    self.condition.notify_all()
+                    break
+
+                self.condition.wait(self.waiting[0][0] - now if self.waiting else None)
+
+        return None
+
+    def refresh(self, user: WatchedUser) -> tuple:
+        """Scrape and cache every section of a user
+
+        Returns:
+            tuple: False if upstream failed for any section, and the stats_signature of the stats section
+        """
+        ok = True
+        signature = None
+        ttl = self.intervals.interval(user) * CACHE_TTL_FACTOR
+
+        for section in self.sections:
+            try:
+                result = SECTIONS[section](user.username)
+                status = status_of(result)
+
+                if status == 200:
+                    result_cache.put(section, user.username, result, dumps(result), ttl=ttl)
+
+                if section == 'stats':
+                    signature = stats_signature(result)
+
+            except Exception as err:
+                print(f'error -> {err}')
+                status = 'error'
+
+            CRAWLER_REFRESHES.inc(section=section, result=status)
+            # unknown users (404) are not an upstream problem
+            ok = ok and status != 'error' and status < 500
+
+        return ok, signature
+
+    def work(self):
+        while True:
+            user = self.next_user()
+
+            if user is None:
+                return
+
+            try:
+                self.pacer.wait()
+                # counts the upstream requests of the refresh, the contest fan-out threads included
+                timings = timing.start_request()
+                ok, signature = self.refresh(user)
+                self.pacer.report(ok)
+                requests = timings.stages.get('ttfb', (0, 0))[1]
+                interval = self.intervals.update(user, signature if 'stats' in self.sections else None, requests)
+
+            finally:
+                with self.condition:
+                    self.running -= 1
+                    self.condition.notify_all()
+
+            if not self.once:
+                self.schedule(user, time.monotonic() + interval)
+
+    def start(self) -> 'Crawler':
+        for number in range(self.workers):
+            thread = threading.Thread(target=self.work, name=f'crawler-{number}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+        return self
+
+    def stop(self):
+        """Stop handing out users and wait for the refreshes in progress"""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+        self.join()
+
+    def join(self, timeout: float = None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        for thread in self.threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def is_alive(self) -> bool:
+        return any(thread.is_alive() for thread in self.threads)
+
+    def report(self) -> dict:
+        """Schedule state, pace and the savings of the adaptive intervals"""
+        with self.condition:
+            scheduled = len(self.waiting) + len(self.ready) + self.running
+            overdue = len(self.ready)
+
+        return dict(self.intervals.report(), scheduled=scheduled, overdue=overdue, rate=self.pacer.rate)
+
+
+# crawler started by start_from_env, reported by /admin/crawler
+running = None
+
+
+def start_from_env():
+    """Crawler over WATCHLIST_FILE running in this process, None if no watchlist is configured"""
+    global running
+
+    if not WATCHLIST_FILE:
+        return None
+
+    if not result_cache.ttl:
+        print('warning -> RESULT_CACHE_TTL is not set, the API will not serve the crawled results')
+
+    running = Crawler(load_watchlist(WATCHLIST_FILE)).start()
+    return running
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Keep the result cache warm for a watchlist of users')
+    parser.add_argument('watchlist', nargs='?', default=WATCHLIST_FILE, help='watchlist file')
+    parser.add_argument('--workers', type=int, default=CRAWLER_WORKERS)
+    parser.add_argument('--sections', nargs='+', default=list(CRAWLER_SECTIONS), choices=list(SECTIONS))
+    parser.add_argument('--once', action='store_true', help='refresh every user once and exit')
+    parser.add_argument('--report-every', type=float, default=300, help='seconds between two printed reports')
+    parser.add_argument('--contest-index', action='append', default=[], metavar='CONTEST[:Field=value]',
+                        help='answer this contest from its rankings pages, see CONTEST_INDEXES')
+    args = parser.parse_args()
+
+    if args.watchlist is None:
+        parser.error('no watchlist given and WATCHLIST_FILE is not set')
+
+    if not result_cache.directory:
+        print('warning -> RESULT_CACHE_DIR is not set, the API processes will not see the crawled results')
+
+    for spec in args.contest_index:
+        contest_index.register(*contest_index.parse_spec(spec))
+
+    # one paging run per contest up front, instead of a search per user and contest while crawling
+    contest_index.build_all()
+
+    users = load_watchlist(args.watchlist)
+    print(f'crawling {len(users)} users, sections {", ".join(args.sections)}')
+    crawler = Crawler(users, args.workers, tuple(args.sections), args.once).start()
+
+    try:
+        while crawler.is_alive():
+            crawler.join(args.report_every)
+            print(json.dumps(crawler.report()))
+
+    except KeyboardInterrupt:
+        crawler.stop()
+        print(json.dumps(crawler.report()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,449 @@
+# ===================================================================
+# ========================== Data Export ============================
+# ===================================================================
+#
+# Streams the whole rankings of a contest to CSV in constant memory, rows are written as the pages arrive.
+#
+#   python export.py rankings START51D [--filter "Institution=IIT Delhi"] [--concurrency 4] [-o out.csv]
+#
+# Exports the stats and contest results of a roster of users as columnar files, one row per user (stats) or
+# per user and contest (contests). Results come from the result cache, misses are scraped and cached. Rows
+# are written in row groups as the users arrive, so memory does not grow with the roster. Every run adds a
+# new part file to the partition of its date, readers like pyarrow.dataset, DuckDB or Spark read a table
+# directory as one dataset:
+#
+#   python export.py users watchlist.txt [--format parquet] [--tables stats,contests] [--output-dir exports]
+#
+#   exports/stats/scrape_date=2022-11-05/part-181502-4242-3f9a1c2e.parquet
+#
+# Parquet and Arrow need the pyarrow package, CSV always works.
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from datetime import datetime, timezone
+from itertools import islice
+from API.cache import result_cache
+from API.endpoints import SECTIONS, status_of
+from API.serialization import dumps
+from crawler import WATCHLIST_FILE
+from scraping_code.rankings import RANKINGS_PAGE_SIZE, iter_rankings
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXPORT_DIR = os.environ.get('EXPORT_DIR', 'exports')
+EXPORT_FORMAT = os.environ.get('EXPORT_FORMAT', 'parquet' if pyarrow is not None else 'csv')
+EXPORT_ROW_GROUP_SIZE = int(os.environ.get('EXPORT_ROW_GROUP_SIZE', 10000))  # rows held before writing
+EXPORT_CONCURRENCY = int(os.environ.get('EXPORT_CONCURRENCY', 4))  # users fetched in parallel
+
+CSV_FIELDS = ('rank', 'user_handle', 'score', 'total_time', 'penalty', 'country', 'institution', 'rating',
+              'problems_solved')
+
+# (column, type) per table, values that do not convert (e.g. the text of unranked users) are left empty
+STATS_COLUMNS = (
+    ('username', str), ('country', str), ('institution', str), ('student_professional', str),
+    ('total_stars', int), ('rating', int), ('division', str), ('global_rank', int), ('country_rank', int),
+    ('problem_fully_solved', int), ('problem_partially_solved', int), ('contest_participate', int),
+    ('exported_at', str),
+)
+CONTEST_COLUMNS = (
+    ('username', str), ('contest_code', str), ('contest_name', str), ('rank', int), ('total_score', float),
+    ('total_solved', int), ('total_problems', int), ('problems_solved', str), ('exported_at', str),
+)
+
+FORMATS = {
+    # format -> (file extension, mimetype)
+    'csv': ('csv', 'text/csv'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('arrows', 'application/vnd.apache.arrow.stream'),
+}
+
+
+def write_csv(rows, file) -> int:
+    """Write rankings rows as CSV_FIELDS, one at a time
+
+    Returns:
+        int: number of rows written
+    """
+    writer = csv.writer(file)
+    writer.writerow(CSV_FIELDS)
+    count = 0
+
+    for row in rows:
+        writer.writerow([len(row.get('problems_status') or ()) if field == 'problems_solved' else row.get(field)
+                         for field in CSV_FIELDS])
+        count += 1
+
+    return count
+
+
+def _cast(value, kind):
+    if value is None:
+        return None
+
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _row(columns: tuple, values: dict) -> tuple:
+    return tuple(_cast(values.get(name), kind) for name, kind in columns)
+
+
+def stats_rows(username: str, data: dict, exported_at: str):
+    """Row of a get_user_stats result"""
+    yield _row(STATS_COLUMNS, dict(data, username=data.get('username') or username,
+                                   student_professional=data.get('student/professional'), exported_at=exported_at))
+
+
+def contest_rows(username: str, data: dict, exported_at: str):
+    """Row per contest of a multiple_threads_scraping result, solved problem codes are comma separated"""
+    for contest in data.get('contest_details', ()):
+        yield _row(CONTEST_COLUMNS, dict(contest, username=username, total_problems=len(contest['total_problems']),
+                                         problems_solved=','.join(contest['problems_solved']),
+                                         exported_at=exported_at))
+
+
+TABLES = {
+    # table -> (columns, result cache section, rows of one result)
+    'stats': (STATS_COLUMNS, 'stats', stats_rows),
+    'contests': (CONTEST_COLUMNS, 'contests', contest_rows),
+}
+
+
+def parse_roster(lines):
+    """Usernames of roster lines, `username [...]` per line like a watchlist, `#` starts a comment"""
+    for line in lines:
+        fields = line.split('#', 1)[0].split()
+
+        if fields:
+            yield fields[0]
+
+
+def iter_roster(path: str):
+    """Usernames of a roster file, read lazily"""
+    with open(path, encoding='utf-8') as file:
+        yield from parse_roster(file)
+
+
+def user_data(section: str, username: str, scrape: bool = True):
+    """Result of a section as plain data, from the result cache or scraped and cached on a miss
+
+    Returns:
+        dict or None: None if the scrape failed, or on a miss when scrape is False
+    """
+    entry = result_cache.get(section, username)
+
+    if entry is not None:
+        # entries read from the disk tier keep their body only
+        return entry.result.to_dict() if entry.result is not None else json.loads(entry.body)
+
+    if not scrape:
+        return None
+
+    try:
+        result = SECTIONS[section](username)
+    except Exception as err:
+        print(f'error -> {err}')
+        return None
+
+    if status_of(result) != 200:
+        return None
+
+    result_cache.put(section, username, result, dumps(result))
+    return result.to_dict()
+
+
+def iter_user_data(section: str, usernames, concurrency: int = EXPORT_CONCURRENCY, scrape: bool = True):
+    """(username, user_data) of every username in order, a few users are fetched ahead in parallel
+
+    Yields:
+        tuple: username and its data, None if it is not available
+    """
+    concurrency = max(1, concurrency)
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        pending = deque()
+
+        try:
+            for username in usernames:
+                pending.append((username, executor.submit(copy_context().run, user_data, section, username, scrape)))
+
+                if len(pending) > concurrency:
+                    username, future = pending.popleft()
+                    yield username, future.result()
+
+            while pending:
+                username, future = pending.popleft()
+                yield username, future.result()
+
+        finally:
+            # stopped early, do not fetch users nobody reads
+            for _, future in pending:
+                future.cancel()
+
+
+def table_rows(table: str, usernames, exported_at: str, concurrency: int = EXPORT_CONCURRENCY, scrape: bool = True):
+    """Rows of a table for every username, users without data are left out"""
+    _, section, to_rows = TABLES[table]
+
+    for username, data in iter_user_data(section, usernames, concurrency, scrape):
+        if data is not None:
+            yield from to_rows(username, data, exported_at)
+
+
+class CsvTableWriter:
+    """Writes rows to a binary file as CSV with a header line"""
+
+    def __init__(self, file, columns: tuple):
+        self.text = io.TextIOWrapper(file, encoding='utf-8', newline='', write_through=True)
+        self.writer = csv.writer(self.text)
+        self.writer.writerow([name for name, _ in columns])
+
+    def write(self, rows: list):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.text.flush()
+        # leave the file open, it belongs to the caller
+        self.text.detach()
+
+
+class ArrowTableWriter:
+    """Writes rows to a parquet or arrow stream writer, one record batch (parquet: row group) per write"""
+
+    def __init__(self, writer, schema):
+        self.writer = writer
+        self.schema = schema
+
+    def write(self, rows: list):
+        columns = zip(*rows)
+        self.writer.write_batch(pyarrow.record_batch(
+            [pyarrow.array(column, field.type) for column, field in zip(columns, self.schema)], schema=self.schema
+        ))
+
+    def close(self):
+        self.writer.close()
+
+
+def open_writer(file, columns: tuple, fmt: str):
+    """Table writer of a format on a binary file
+
+    Args:
+        file: binary file, left open when the writer is closed
+        columns (tuple): (column, type) of the table
+        fmt (str): csv, parquet or arrow (arrow IPC stream)
+
+    Raises:
+        ValueError: unknown format, or parquet/arrow without pyarrow installed
+    """
+    if fmt == 'csv':
+        return CsvTableWriter(file, columns)
+
+    if fmt not in FORMATS:
+        raise ValueError(f'unknown format {fmt}, expected one of {", ".join(FORMATS)}')
+
+    if pyarrow is None:
+        raise ValueError(f'{fmt} export needs the pyarrow package, use csv or install pyarrow')
+
+    types = {str: pyarrow.string(), int: pyarrow.int64(), float: pyarrow.float64()}
+    schema = pyarrow.schema([(name, types[kind]) for name, kind in columns])
+
+    if fmt == 'parquet':
+        return ArrowTableWriter(pyarrow.parquet.ParquetWriter(file, schema), schema)
+
+    return ArrowTableWriter(pyarrow.ipc.new_stream(file, schema), schema)
+
+
+def _write_groups(writer, rows, row_group_size: int):
+    """Write rows in groups of row_group_size, yielding the size of every group after it is written"""
+    rows = iter(rows)
+
+    try:
+        while True:
+            group = list(islice(rows, max(1, row_group_size)))
+
+            if not group:
+                return
+
+            writer.write(group)
+            yield len(group)
+
+    finally:
+        writer.close()
+
+
+def write_table(rows, file, columns: tuple, fmt: str, row_group_size: int = EXPORT_ROW_GROUP_SIZE) -> int:
+    """Write rows to a binary file, see open_writer
+
+    Returns:
+        int: number of rows written
+    """
+    return sum(_write_groups(open_writer(file, columns, fmt), rows, row_group_size))
+
+
+class ChunkSink(io.RawIOBase):
+    """Write only file keeping what is written until it is drained"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def stream_table(rows, columns: tuple, fmt: str, row_group_size: int = EXPORT_ROW_GROUP_SIZE):
+    """Bytes of a table file, a chunk per row group, e.g. for a streamed response
+
+    Raises:
+        ValueError: see open_writer, raised on the call rather than on the first chunk
+    """
+    sink = ChunkSink()
+    writer = open_writer(sink, columns, fmt)
+
+    def chunks():
+        for _ in _write_groups(writer, rows, row_group_size):
+            yield sink.drain()
+
+        # footer of parquet files, end of stream marker of arrow streams
+        yield sink.drain()
+
+    return chunks()
+
+
+def write_partition(rows, directory: str, table: str, fmt: str, scrape_date: str,
+                    row_group_size: int = EXPORT_ROW_GROUP_SIZE) -> tuple:
+    """Add a part file with rows to the `scrape_date=` partition of a table
+
+    Args:
+        rows: rows of the table
+        directory (str): export directory, the table is written to <directory>/<table>
+        table (str): stats or contests
+        fmt (str): csv, parquet or arrow
+        scrape_date (str): partition, e.g. 2022-11-05
+
+    Returns:
+        tuple: path of the part file and number of rows written
+    """
+    columns = TABLES[table][0]
+    partition = os.path.join(directory, table, f'scrape_date={scrape_date}')
+    name = f'part-{time.strftime("%H%M%S")}-{os.getpid()}-{uuid.uuid4().hex[:8]}.{FORMATS[fmt][0]}'
+    path = os.path.join(partition, name)
+    # dot files are skipped by dataset readers, so a part being written is never read half done
+    temporary = os.path.join(partition, f'.{name}.tmp')
+
+    os.makedirs(partition, exist_ok=True)
+
+    try:
+        with open(temporary, 'wb') as file:
+            count = write_table(rows, file, columns, fmt, row_group_size)
+        os.replace(temporary, path)
+
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+    return path, count
+
+
+def export_rankings(args):
+    rows = iter_rankings(args.contest, args.filter_by, args.page_size, args.concurrency)
+
+    if args.output is None:
+        count = write_csv(rows, sys.stdout)
+    else:
+        with open(args.output, 'w', newline='', encoding='utf-8') as file:
+            count = write_csv(rows, file)
+
+    print(f'{count} rows', file=sys.stderr)
+
+
+def export_users(args):
+    now = datetime.now(timezone.utc)
+    exported_at = now.isoformat(timespec='seconds')
+
+    for table in args.tables:
+        rows = table_rows(table, iter_roster(args.roster), exported_at, args.concurrency, not args.cached_only)
+
+        if args.stdout:
+            count = write_table(rows, sys.stdout.buffer, TABLES[table][0], args.format, args.row_group_size)
+            print(f'{table}: {count} rows', file=sys.stderr)
+        else:
+            path, count = write_partition(rows, args.output_dir, table, args.format, now.date().isoformat(),
+                                          args.row_group_size)
+            print(f'{table}: {count} rows -> {path}', file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export rankings and user results as CSV, Parquet or Arrow')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    rankings = commands.add_parser('rankings', help='the whole rankings of a contest as CSV')
+    rankings.add_argument('contest', help='contest code, e.g. START51D')
+    rankings.add_argument('--filter', dest='filter_by', help='e.g. "Institution=IIT Delhi" or "Country=India"')
+    rankings.add_argument('--page-size', type=int, default=RANKINGS_PAGE_SIZE)
+    rankings.add_argument('--concurrency', type=int, default=1, help='pages fetched ahead in parallel')
+    rankings.add_argument('-o', '--output', help='csv file, standard output by default')
+    rankings.set_defaults(export=export_rankings)
+
+    users = commands.add_parser('users', help='stats and contest results of a roster as columnar files')
+    users.add_argument('roster', nargs='?', default=WATCHLIST_FILE,
+                       help='file with one username per line, a watchlist works too (default: WATCHLIST_FILE)')
+    users.add_argument('--tables', type=lambda value: value.split(','), default=list(TABLES),
+                       help=f'comma separated, of {", ".join(TABLES)}')
+    users.add_argument('--format', choices=FORMATS, default=EXPORT_FORMAT)
+    users.add_argument('--output-dir', default=EXPORT_DIR)
+    users.add_argument('--stdout', action='store_true', help='write the single table to standard output instead')
+    users.add_argument('--cached-only', action='store_true', help='skip users missing from the result cache')
+    users.add_argument('--concurrency', type=int, default=EXPORT_CONCURRENCY, help='users fetched in parallel')
+    users.add_argument('--row-group-size', type=int, default=EXPORT_ROW_GROUP_SIZE)
+    users.set_defaults(export=export_users)
+
+    args = parser.parse_args()
+
+    if args.command == 'users':
+        if args.roster is None:
+            parser.error('a roster file or WATCHLIST_FILE is required')
+
+        if any(table not in TABLES for table in args.tables):
+            parser.error(f'tables must be of {", ".join(TABLES)}')
+
+        if args.stdout and len(args.tables) != 1:
+            parser.error('--stdout writes a single table, pick it with --tables')
+
+        if args.format != 'csv' and pyarrow is None:
+            parser.error(f'{args.format} export needs the pyarrow package, use --format csv or install pyarrow')
+
+    args.export(args)
+
+
+if __name__ == "__main__":
+    main()
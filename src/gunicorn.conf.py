@@ -0,0 +1,91 @@
+# ===================================================================
+# ================== Production Server Configuration ================
+# ===================================================================
+#
+# Pre-forking gunicorn setup, run from src/ with `gunicorn app:app` (this file is picked up automatically).
+# The app and the heavy parsing/browser modules are imported once in the master before forking, so workers
+# share them copy-on-write. Workers are recycled after a number of requests or when their RSS grows past a
+# limit, and on shutdown finish their in-flight scrapes and close their browsers.
+
+import multiprocessing
+import os
+import tempfile
+
+bind = os.environ.get('BIND', f'0.0.0.0:{os.environ.get("PORT", 5000)}')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# scrapes mostly wait on upstream, threads keep a worker busy while others sleep on the network
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+preload_app = True
+
+# recycle workers to contain memory growth of Chrome and BeautifulSoup, the jitter keeps them from all
+# restarting at once
+max_requests = int(os.environ.get('MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('MAX_REQUESTS_JITTER', 100))
+WORKER_MAX_RSS_MB = int(os.environ.get('WORKER_MAX_RSS_MB', 512))  # 0 disables the check
+
+# a profile scrape can take several upstream round trips with backoff in between, give them time to finish
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', 120))
+
+# every worker appends to the same trace file, trace a sample of the requests only
+os.environ.setdefault('TRACE_SAMPLE_RATE', '0.01')
+
+# the upstream rate limit is shared through RESULT_CACHE_DIR, without it every worker gets its share
+if float(os.environ.get('UPSTREAM_RATE', 0)) and not os.environ.get('RESULT_CACHE_DIR'):
+    os.environ['UPSTREAM_RATE'] = str(float(os.environ['UPSTREAM_RATE']) / workers)
+
+# /metrics of any worker reports the values of all of them
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), f'codechef_api_metrics_{os.getpid()}'))
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MiB"""
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+    except (OSError, ValueError):
+        # no procfs (macOS), fall back to the peak RSS
+        import resource
+        import sys
+
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / 2 ** 20 if sys.platform == 'darwin' else rss / 1024
+
+
+def on_starting(server):
+    # import what workers would otherwise each import on their first request, before forking
+    import bs4  # noqa: F401
+    from user_agents import get_user_agent_pool
+
+    get_user_agent_pool()
+
+    try:
+        from selenium import webdriver  # noqa: F401
+        from webdriver_manager.chrome import ChromeDriverManager  # noqa: F401
+    except ImportError as err:
+        server.log.warning(f'selenium not preloaded -> {err}')
+
+
+def post_request(worker, req, environ, resp):
+    if not WORKER_MAX_RSS_MB or not worker.alive:
+        return
+
+    rss = current_rss_mb()
+
+    if rss > WORKER_MAX_RSS_MB:
+        # stops accepting new requests, finishes the current ones and exits, the master starts a new worker
+        worker.log.info(f'worker {worker.pid} uses {rss:.0f} MiB > {WORKER_MAX_RSS_MB} MiB, recycling')
+        worker.alive = False
+
+
+def worker_exit(server, worker):
+    import metrics
+    import parse_pool
+    from scraping_code.profile_scraper import quit_all_drivers
+
+    quit_all_drivers()
+    parse_pool.shutdown()
+    metrics.flush()
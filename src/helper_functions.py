@@ -1,14 +1,243 @@
+import os
 import random
+import struct
+import threading
 import time
 import requests
+from contextvars import copy_context
 from typing import Any
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 from bs4 import BeautifulSoup
-from user_agents import USER_AGENTS
+from user_agents import get_user_agent_pool
+from http_archive import HTTP_ARCHIVE_MODE, HTTP_REPLAY_SPEED, NotInArchive, archive
+from profiling import profiled
+from timing import record, stage
+from tracing import span
+from metrics import EXECUTOR_QUEUE_DEPTH, UPSTREAM_BYTES, UPSTREAM_FETCHES, UPSTREAM_RATE_LIMIT_WAIT, \
+    UPSTREAM_RETRIES, UPSTREAM_RETRY_SLEEP, USER_AGENT_EVICTIONS
 
-BASE_URL = 'https://www.codechef.com'
+# upstream urls can be pointed at a stand-in server, e.g. benchmarks/mock_codechef.py
+BASE_URL = os.environ.get('CODECHEF_BASE_URL', 'https://www.codechef.com')
+RANKINGS_URL = os.environ.get('CODECHEF_RANKINGS_URL', BASE_URL + '/api/rankings')
 MAX_RETIRES = 5
-MIN_TIME_SLEEP = 15  # in seconds
-MAX_TIME_SLEEP = 45  # in seconds
+MIN_TIME_SLEEP = int(os.environ.get('MIN_TIME_SLEEP', 15))  # in seconds
+MAX_TIME_SLEEP = int(os.environ.get('MAX_TIME_SLEEP', 45))  # in seconds
+SESSION_POOL_SIZE = int(os.environ.get('SESSION_POOL_SIZE', 10))  # idle sessions kept, more after bursts
+UPSTREAM_RATE = float(os.environ.get('UPSTREAM_RATE', 0))  # requests per second, 0 is unlimited
+UPSTREAM_BURST = int(os.environ.get('UPSTREAM_BURST', 10))  # requests allowed at once after an idle period
+# the rate limit is shared by every process (API workers, the crawler) using the same result cache directory
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR')
+
+
+def url_kind(url: str) -> str:
+    """Kind of upstream url, rankings for the contest api and profile for everything else"""
+    return 'rankings' if '/api/rankings/' in url else 'profile'
+
+
+class SessionPool:
+    """Pool of keep-alive sessions, each pinned to one user agent for its whole life like a real browser
+
+    A session whose user agent gets evicted for being throttled is closed, its replacement opens a new
+    connection with a new user agent. Idle sessions are kept up to `size` or the most sessions ever in use at
+    once, whichever is larger, so a burst of concurrent requests reuses its connections instead of opening and
+    closing them.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.lock = threading.Lock()
+        self.idle = []
+        self.in_use = 0
+        self.high_water = size  # most sessions in use at once, at least size
+
+    def acquire(self) -> requests.Session:
+        with self.lock:
+            self.in_use += 1
+            self.high_water = max(self.high_water, self.in_use)
+
+            if self.idle:
+                return self.idle.pop()
+
+        pool = get_user_agent_pool()
+        session = requests.Session()
+        session.user_agent_index = pool.pick()
+        session.headers['user-agent'] = pool.agents[session.user_agent_index]
+        return session
+
+    def release(self, session: requests.Session, status_code: int = None):
+        """Give a session back, reporting the status of its last response to the user agent pool"""
+        pool = get_user_agent_pool()
+
+        if status_code is not None and pool.report(session.user_agent_index, status_code):
+            USER_AGENT_EVICTIONS.inc()
+
+        with self.lock:
+            self.in_use -= 1
+
+            if pool.is_active(session.user_agent_index) and len(self.idle) < self.high_water:
+                self.idle.append(session)
+                return
+
+        session.close()
+
+
+sessions = SessionPool(SESSION_POOL_SIZE)
+
+
+class RateLimiter:
+    """Token bucket shared by every thread of the process, and with a path by every process using it: `rate`
+    requests per second on average, up to `burst` at once
+
+    Args:
+        rate (float): tokens added per second, 0 disables the limit
+        burst (int): bucket size
+        path (str): file holding the bucket of all processes, None keeps it in this process
+    """
+    STATE = struct.Struct('dd')  # tokens, unix time they were counted at
+
+    def __init__(self, rate: float, burst: int, path: str = None):
+        self.rate = rate
+        self.burst = burst
+        self.path = path if fcntl is not None else None
+        self.tokens = float(burst)
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def take(self, tokens: float, updated: float) -> tuple:
+        """Reserve a token from a bucket, returns its new state and the seconds to wait for the token"""
+        now = time.time()
+        tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+        # reserve the token right away, a negative balance queues the callers behind each other
+        tokens -= 1
+        return tokens, now, -tokens / self.rate if tokens < 0 else 0
+
+    def take_shared(self) -> float:
+        """Reserve a token from the bucket in the file, under a lock held by one process at a time"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        # opened per call, a descriptor inherited by forked workers would share their lock
+        with open(self.path, 'a+b') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            file.seek(0)
+            state = file.read(self.STATE.size)
+            tokens, updated = self.STATE.unpack(state) if len(state) == self.STATE.size else (self.burst, 0.0)
+            tokens, updated, wait = self.take(tokens, updated)
+            file.truncate(0)
+            file.write(self.STATE.pack(tokens, updated))
+            return wait
+
+    def acquire(self):
+        """Take a token, sleeping until one is available"""
+        if not self.rate:
+            return
+
+        with self.lock:
+            if self.path:
+                try:
+                    wait = self.take_shared()
+                except OSError as err:
+                    print(f'error -> {err}')
+                    self.path = None
+
+            if not self.path:
+                self.tokens, self.updated, wait = self.take(self.tokens, self.updated)
+
+        if wait:
+            time.sleep(wait)
+            record('rate_limit', wait)
+            UPSTREAM_RATE_LIMIT_WAIT.inc(wait)
+
+
+rate_limiter = RateLimiter(UPSTREAM_RATE, UPSTREAM_BURST,
+                           os.path.join(RESULT_CACHE_DIR, '.upstream_rate') if RESULT_CACHE_DIR else None)
+
+
+def fetch(url: str, headers: dict):
+    """Single GET request, recorded to or served from the http archive depending on HTTP_ARCHIVE_MODE
+
+    Args:
+        url (str): url to fetch
+        headers (dict): request headers
+
+    Returns:
+        requests.Response or http_archive.ReplayResponse: upstream response
+    """
+    start = time.perf_counter()
+    kind = url_kind(url)
+
+    if HTTP_ARCHIVE_MODE == 'replay':
+        res = archive.replay(url)
+        record('ttfb', time.perf_counter() - start)
+        UPSTREAM_FETCHES.inc(kind=kind, status=res.status_code)
+        return res
+
+    rate_limiter.acquire()
+    start = time.perf_counter()
+
+    # stream so the time to the response headers (dns, connect, tls and server time) and the body download
+    # can be told apart
+    session = sessions.acquire()
+
+    try:
+        res = session.get(url, timeout=120, headers=headers, stream=True)
+        headers_received = time.perf_counter()
+        content = res.content
+        downloaded = time.perf_counter()
+    except Exception:
+        UPSTREAM_FETCHES.inc(kind=kind, status='error')
+        sessions.release(session)
+        raise
+
+    sessions.release(session, res.status_code)
+    record('ttfb', headers_received - start)
+    record('download', downloaded - headers_received, len(content))
+    UPSTREAM_FETCHES.inc(kind=kind, status=res.status_code)
+    UPSTREAM_BYTES.inc(len(content), kind=kind)
+
+    if HTTP_ARCHIVE_MODE == 'record':
+        archive.record(url, res, time.perf_counter() - start)
+
+    return res
+
+
+def backoff():
+    """Sleep between two attempts of a failed request
+
+    A replay sleeps the mean back-off scaled by HTTP_REPLAY_SPEED instead of a random one, so replays are
+    reproducible and HTTP_REPLAY_SPEED=0 retries right away.
+    """
+    if HTTP_ARCHIVE_MODE == 'replay':
+        duration = (MIN_TIME_SLEEP + MAX_TIME_SLEEP) / 2 * HTTP_REPLAY_SPEED
+    else:
+        duration = random.randrange(MIN_TIME_SLEEP, MAX_TIME_SLEEP)
+
+    start = time.perf_counter()
+    time.sleep(duration)
+    slept = time.perf_counter() - start
+
+    record('retry_sleep', slept)
+    UPSTREAM_RETRIES.inc()
+    UPSTREAM_RETRY_SLEEP.inc(slept)
+
+
+def context_map(executor, fn, *iterables):
+    """executor.map that runs every call in a copy of the caller's context, so request scoped context
+    variables (stage timings, the trace, a ?profile=1 profile) are visible inside the worker threads"""
+    def run(*args):
+        EXECUTOR_QUEUE_DEPTH.dec()
+        return profiled(fn, *args)
+
+    futures = []
+    for args in zip(*iterables):
+        EXECUTOR_QUEUE_DEPTH.inc()
+        futures.append(executor.submit(copy_context().run, run, *args))
+
+    return (future.result() for future in futures)
 
 
 def get_response(url: str, r_type: Any = 'soup', custom_headers: dict = None):
@@ -16,39 +245,59 @@ def get_response(url: str, r_type: Any = 'soup', custom_headers: dict = None):
 
     Args:
         url (str): profile url on codechef
-        r_type (str): return type json or soup object, default return type is soup
+        r_type (str): return type json, bytes or soup object, default return type is soup
         custom_headers (dict): custom headers you want to send
 
     Returns:
-        Any: if r_type is soup then (bs4.BeautifulSoup)BeautifulSoup object to parse the HTML were return otherwise json
+        Any: if r_type is soup then (bs4.BeautifulSoup)BeautifulSoup object to parse the HTML were return, the raw
+        body if r_type is bytes, otherwise json
     """
-    # loop to retry the request for MAX_RETRIES times
-    for _ in range(MAX_RETIRES):
-        try:
+    with span(f'fetch {url_kind(url)}', url=url) as fetch_span:
+
+        # loop to retry the request for MAX_RETRIES times
+        for attempt in range(MAX_RETIRES):
+            fetch_span.set('retries', attempt)
+
+            with span('attempt', attempt=attempt) as attempt_span:
+                try:
+
+                    res = fetch(url, custom_headers)
+                    attempt_span.set('status', res.status_code)
+                    attempt_span.set('bytes', len(res.content))
+
+                    # check if the request is successful
+                    if res.ok:
+
+                        if r_type == 'bytes':
+                            # parsed by the caller, possibly in another process (see parse_pool)
+                            return res.content
 
-            if custom_headers is None:
-                custom_headers = {}
+                        with stage('parse'):
+                            if r_type == 'soup':
+                                soup = BeautifulSoup(res.content, 'html.parser')
+                                return soup
 
-            custom_headers['user-agent'] = random.choice(USER_AGENTS)['User-Agent']
-            res = requests.get(url, timeout=120, headers=custom_headers)
+                            else:
+                                return res.json()
 
-            # check if the request is successful
-            if res.ok:
+                    else:
+                        print(f'\nBad status code -> {res.status_code}')
+                        attempt_span.set_status('ERROR')
 
-                if r_type == 'soup':
-                    soup = BeautifulSoup(res.content, 'html.parser')
-                    return soup
+                except NotInArchive as err:
+                    # a retry would miss the archive again
+                    print(f'\nnot in archive -> {err}')
+                    attempt_span.record_error(err)
+                    fetch_span.set_status('ERROR')
+                    return None
 
-                else:
-                    return res.json()
+                except Exception as err:
+                    print(f'\nerror -> {err}')
+                    attempt_span.record_error(err)
 
-            else:
-                print(f'\nBad status code -> {res.status_code}')
-                time.sleep(random.randrange(MIN_TIME_SLEEP, MAX_TIME_SLEEP))
+            backoff()
 
-        except Exception as err:
-            print(f'\nerror -> {err}')
-            time.sleep(random.randrange(MIN_TIME_SLEEP, MAX_TIME_SLEEP))
+        fetch_span.set_status('ERROR')
 
     # return None if soup object or json is not returned after MAX_RETRIES
     return None
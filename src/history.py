@@ -0,0 +1,210 @@
+# ===================================================================
+# ===================== Rating and Rank History =====================
+# ===================================================================
+#
+# Append-only SQLite store with a snapshot of rating, ranks, solved problems and stars after every successful
+# stats scrape, so trends do not need a scrape per point. Snapshots of a user are clustered on (user, time),
+# a range query is one index seek. Most snapshots store the change since the previous one: SQLite stores
+# integers in as few bytes as they need and unchanged values (0) in none, so a snapshot takes 20-25 bytes on
+# disk and millions fit in a few tens of MiB. Every HISTORY_KEYFRAME_INTERVAL-th snapshot of a user stores
+# full values, a range query decodes from the keyframe before its start.
+#
+# Set HISTORY_DB to a file shared by the API workers and the crawler to enable it.
+
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from API.cache import result_cache
+from scraping_code.models import UserStats
+
+HISTORY_DB = os.environ.get('HISTORY_DB')  # sqlite file, unset disables the history
+HISTORY_KEYFRAME_INTERVAL = int(os.environ.get('HISTORY_KEYFRAME_INTERVAL', 32))  # snapshots per full snapshot
+HISTORY_MAX_SNAPSHOTS = int(os.environ.get('HISTORY_MAX_SNAPSHOTS', 10000))  # per response, the latest ones
+
+LAST_TS = 2 ** 62  # upper bound of open ranges
+
+FIELDS = ('rating', 'global_rank', 'country_rank', 'problems_solved', 'stars')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE
+);
+
+-- keyframe rows hold values, the others the difference to the previous snapshot, NULL is a missing value
+-- (e.g. the rank of an unranked user) and a change from or to NULL is always a keyframe
+CREATE TABLE IF NOT EXISTS snapshots (
+    user_id INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    keyframe INTEGER NOT NULL,
+    rating INTEGER,
+    global_rank INTEGER,
+    country_rank INTEGER,
+    problems_solved INTEGER,
+    stars INTEGER,
+    PRIMARY KEY (user_id, ts)
+) WITHOUT ROWID;
+'''
+
+
+def stats_values(stats: UserStats) -> tuple:
+    """FIELDS of a get_user_stats result, ranks codechef shows as text are None"""
+    values = (stats.rating, stats.global_rank, stats.country_rank, stats.problem_fully_solved, stats.total_stars)
+    return tuple(value if isinstance(value, int) else None for value in values)
+
+
+def decode(rows):
+    """(ts, values) of snapshot rows in time order, starting at a keyframe"""
+    values = None
+
+    for ts, keyframe, *fields in rows:
+        if keyframe:
+            values = tuple(fields)
+        else:
+            values = tuple(None if delta is None else value + delta for value, delta in zip(values, fields))
+
+        yield ts, values
+
+
+class SnapshotStore:
+    """Snapshots of FIELDS per user in a SQLite file, see the comment on top
+
+    Args:
+        path (str): database file, created on first use
+        keyframe_interval (int): snapshots of a user between two keyframes
+    """
+
+    def __init__(self, path: str, keyframe_interval: int):
+        self.path = path
+        self.keyframe_interval = max(1, keyframe_interval)
+        # connections are opened lazily, so a preloading server does not share one with its workers
+        self.local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        """Connection of the current thread"""
+        connection = getattr(self.local, 'connection', None)
+
+        if connection is None:
+            # autocommit, append manages its transaction itself
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            # readers do not block the writer, and a commit does not wait for the disk
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self.local.connection = connection
+
+        return connection
+
+    @staticmethod
+    def user_id(connection: sqlite3.Connection, username: str, create: bool = False):
+        """Id of a user, None if it has no snapshots and create is False"""
+        if create:
+            connection.execute('INSERT OR IGNORE INTO users (username) VALUES (?)', (username.lower(),))
+
+        row = connection.execute('SELECT id FROM users WHERE username = ?', (username.lower(),)).fetchone()
+        return row[0] if row is not None else None
+
+    @staticmethod
+    def rows(connection: sqlite3.Connection, user_id: int, start: int = None, end: int = None) -> list:
+        """Snapshot rows of a user from the last keyframe at or before start (the first one without a start) up
+        to end"""
+        first = 0
+
+        if start is not None:
+            keyframe = connection.execute(
+                'SELECT ts FROM snapshots WHERE user_id = ? AND ts <= ? AND keyframe = 1 ORDER BY ts DESC LIMIT 1',
+                (user_id, start)
+            ).fetchone()
+            # none if start lies before the first snapshot, which is a keyframe
+            first = keyframe[0] if keyframe is not None else start
+
+        return connection.execute(
+            f'SELECT ts, keyframe, {", ".join(FIELDS)} FROM snapshots WHERE user_id = ? AND ts >= ? AND ts <= ? '
+            f'ORDER BY ts',
+            (user_id, first, end if end is not None else LAST_TS)
+        ).fetchall()
+
+    def append(self, username: str, values: tuple, ts: int = None) -> bool:
+        """Add a snapshot
+
+        Args:
+            username (str): profile name on codechef
+            values (tuple): FIELDS, None where a value is missing
+            ts (int): unix time in seconds, now by default
+
+        Returns:
+            bool: False if the user already has a snapshot at ts or later
+        """
+        ts = int(time.time()) if ts is None else ts
+        connection = self.connection()
+        # takes the write lock right away, so two processes cannot compute deltas from the same last snapshot
+        connection.execute('BEGIN IMMEDIATE')
+
+        try:
+            user_id = self.user_id(connection, username, create=True)
+            last = self.rows(connection, user_id, start=LAST_TS)
+            previous = None
+
+            if last:
+                previous_ts, previous = list(decode(last))[-1]
+
+                if ts <= previous_ts:
+                    connection.execute('ROLLBACK')
+                    return False
+
+            keyframe = previous is None or len(last) >= self.keyframe_interval or \
+                any((value is None) != (before is None) for value, before in zip(values, previous))
+
+            if not keyframe:
+                values = tuple(None if value is None else value - before for value, before in zip(values, previous))
+
+            connection.execute(
+                f'INSERT INTO snapshots (user_id, ts, keyframe, {", ".join(FIELDS)}) '
+                f'VALUES (?, ?, ?{", ?" * len(FIELDS)})',
+                (user_id, ts, int(keyframe), *values)
+            )
+            connection.execute('COMMIT')
+            return True
+
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def history(self, username: str, start: int = None, end: int = None, limit: int = HISTORY_MAX_SNAPSHOTS) -> list:
+        """Snapshots of a user between start and end, both included
+
+        Args:
+            username (str): profile name on codechef
+            start (int): unix time in seconds, from the first snapshot if None
+            end (int): unix time in seconds, up to the last snapshot if None
+            limit (int): the latest limit snapshots are returned
+
+        Returns:
+            list: dicts with `timestamp` and FIELDS, oldest first
+        """
+        connection = self.connection()
+        user_id = self.user_id(connection, username)
+
+        if user_id is None:
+            return []
+
+        snapshots = deque(maxlen=max(1, limit))
+
+        for ts, values in decode(self.rows(connection, user_id, start, end)):
+            if start is None or ts >= start:
+                snapshots.append(dict(zip(FIELDS, values), timestamp=ts))
+
+        return list(snapshots)
+
+    def record_stats(self, username: str, result):
+        """ResultCache listener of the stats section"""
+        if isinstance(result, UserStats):
+            self.append(username, stats_values(result))
+
+
+snapshots = SnapshotStore(HISTORY_DB, HISTORY_KEYFRAME_INTERVAL) if HISTORY_DB else None
+
+if snapshots is not None:
+    result_cache.on_put('stats', snapshots.record_stats)
@@ -0,0 +1,196 @@
+# ===================================================================
+# ================= Record and Replay of HTTP traffic ===============
+# ===================================================================
+#
+# HTTP_ARCHIVE_MODE=record stores every upstream response get_response receives in a gzip compressed
+# JSON lines archive, HTTP_ARCHIVE_MODE=replay serves them back without touching the network.
+# HTTP_REPLAY_SPEED scales the recorded response times: 1 replays them as recorded, 0.5 twice as fast,
+# 0 without any delay. A url that was never recorded raises NotInArchive, it is not retried.
+
+import atexit
+import base64
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+from requests.structures import CaseInsensitiveDict
+
+HTTP_ARCHIVE_MODE = os.environ.get('HTTP_ARCHIVE_MODE', 'off')  # off, record or replay
+HTTP_ARCHIVE_PATH = os.environ.get('HTTP_ARCHIVE_PATH', 'http_archive.jsonl.gz')
+HTTP_REPLAY_SPEED = float(os.environ.get('HTTP_REPLAY_SPEED', 1))
+FLUSH_INTERVAL = 5  # seconds between flushes of the archive while recording, every flush restarts compression
+
+# never persist credentials handed out by upstream
+SKIPPED_HEADERS = {'set-cookie'}
+
+
+def archive_key(url: str) -> str:
+    """Path and query of url, so an archive recorded against one upstream host replays against any other"""
+    parts = urlsplit(url)
+    return f'{parts.path}?{parts.query}' if parts.query else parts.path
+
+
+class NotInArchive(LookupError):
+    """Raised on replay of a url the archive has no response for"""
+
+
+class ReplayResponse:
+    """Recorded response exposing the parts of requests.Response get_response uses"""
+
+    def __init__(self, url: str, status_code: int, headers: dict, content: bytes, elapsed: float):
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def encode_entry(url: str, status_code: int, headers: dict, content: bytes, elapsed: float) -> str:
+    """One archive line, bodies are kept as text when possible so gzip can compress them well"""
+    entry = {
+        'url': url,
+        'status': status_code,
+        'headers': {key: value for key, value in headers.items() if key.lower() not in SKIPPED_HEADERS},
+        'elapsed': round(elapsed, 6),
+    }
+
+    try:
+        entry['body'] = content.decode('utf-8')
+    except UnicodeDecodeError:
+        entry['body_b64'] = base64.b64encode(content).decode('ascii')
+
+    return json.dumps(entry, separators=(',', ':'))
+
+
+def decode_entry(line: str) -> ReplayResponse:
+    entry = json.loads(line)
+
+    if 'body_b64' in entry:
+        content = base64.b64decode(entry['body_b64'])
+    else:
+        content = entry['body'].encode('utf-8')
+
+    return ReplayResponse(entry['url'], entry['status'], entry['headers'], content, entry['elapsed'])
+
+
+class HttpArchive:
+    """On-disk archive of upstream responses
+
+    Args:
+        path (str): archive file, gzip compressed JSON lines
+        speed (float): replay time scale, 0 serves recorded responses without delay
+    """
+
+    def __init__(self, path: str, speed: float = 1.0):
+        self.path = path
+        self.speed = speed
+        self.lock = threading.Lock()
+        self.file = None
+        self.flushed = 0.0
+        self.responses = None
+        self.positions = defaultdict(int)
+
+    def record(self, url: str, res, elapsed: float):
+        """Append a live requests.Response to the archive"""
+        line = encode_entry(url, res.status_code, res.headers, res.content, elapsed)
+
+        with self.lock:
+            if self.file is None:
+                # append mode adds a new gzip member, so an archive can be recorded across several runs
+                self.file = gzip.open(self.path, 'at', encoding='utf-8')
+                atexit.register(self.close)
+
+            self.file.write(line + '\n')
+
+            # a flush ends the compressed block, flush now and then so a killed recording loses little
+            if time.monotonic() - self.flushed > FLUSH_INTERVAL:
+                self.file.flush()
+                self.flushed = time.monotonic()
+
+    def load(self):
+        """Read the archive into memory, grouped by url in recording order"""
+        responses = defaultdict(list)
+
+        with gzip.open(self.path, 'rt', encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    res = decode_entry(line)
+                    responses[archive_key(res.url)].append(res)
+
+        self.responses = responses
+
+    def replay(self, url: str) -> ReplayResponse:
+        """Next recorded response for url
+
+        Urls are matched on path and query. Responses for the same url are served in recording order
+        and wrap around, so a recorded 429 followed by a 200 replays the same retry sequence.
+
+        Returns:
+            ReplayResponse: recorded response
+
+        Raises:
+            NotInArchive: the url was never recorded
+        """
+        with self.lock:
+            if self.responses is None:
+                self.load()
+
+            key = archive_key(url)
+            recorded = self.responses.get(key)
+
+            if not recorded:
+                raise NotInArchive(url)
+
+            res = recorded[self.positions[key] % len(recorded)]
+            self.positions[key] += 1
+
+        if self.speed > 0:
+            time.sleep(res.elapsed * self.speed)
+
+        return res
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+archive = HttpArchive(HTTP_ARCHIVE_PATH, HTTP_REPLAY_SPEED)
+
+
+def summary(path: str) -> dict:
+    """Status code and url kind counts of an archive"""
+    statuses = Counter()
+    kinds = Counter()
+    total_bytes = 0
+
+    with gzip.open(path, 'rt', encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                res = decode_entry(line)
+                statuses[res.status_code] += 1
+                kinds['rankings' if '/api/rankings/' in res.url else 'profile'] += 1
+                total_bytes += len(res.content)
+
+    return {'responses': sum(statuses.values()), 'statuses': dict(statuses), 'kinds': dict(kinds),
+            'body_bytes': total_bytes, 'archive_bytes': os.path.getsize(path)}
+
+
+if __name__ == "__main__":
+    print(summary(sys.argv[1] if len(sys.argv) > 1 else HTTP_ARCHIVE_PATH))
@@ -0,0 +1,325 @@
+# ===================================================================
+# ================ Prometheus compatible process metrics ============
+# ===================================================================
+#
+# Counters, gauges and histograms kept in plain dicts behind a lock, rendered in the Prometheus text
+# exposition format by the /metrics endpoint. With several worker processes set METRICS_DIR to a directory
+# shared by all of them: every process dumps its values there at most every METRICS_FLUSH_INTERVAL seconds
+# and /metrics merges the files of all workers. Counters of exited workers are kept, gauges are dropped: the
+# files of exited workers are folded into one metrics_dead.json and removed, so recycled workers do not pile up.
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))  # in seconds
+
+DEAD_FILE = 'metrics_dead.json'  # counters and histograms of exited processes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Metric:
+    """Base of all metric types, values are keyed by the tuple of label values"""
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        REGISTRY.append(self)
+
+    def key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def dump(self) -> list:
+        with self.lock:
+            return [[list(key), value] for key, value in self.values.items()]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+
+        # expose unlabelled counters from the start, so rate() works before the first increment
+        if not self.labelnames:
+            self.values[()] = 0
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+        maybe_flush()
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+
+        if not self.labelnames:
+            self.values[()] = 0
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+        maybe_flush()
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self.key(labels)
+
+        with self.lock:
+            self.values[key] = value
+
+        maybe_flush()
+
+
+class Histogram(Metric):
+    """Histogram, each value is [count per bucket..., count above the last bucket, sum]"""
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        index = bisect_left(self.buckets, value)
+
+        with self.lock:
+            counts = self.values.get(key)
+
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+
+            counts[index] += 1
+            counts[-1] += value
+
+        maybe_flush()
+
+    def dump(self) -> list:
+        with self.lock:
+            return [[list(key), list(value)] for key, value in self.values.items()]
+
+
+REGISTRY = []
+_last_flush = 0.0
+_flush_lock = threading.Lock()
+_flushed_pid = None  # pid the last flush was written by, differs in a forked or new process
+
+
+def snapshot() -> dict:
+    """Values of every metric of this process"""
+    return {metric.name: metric.dump() for metric in REGISTRY}
+
+
+def flush():
+    """Write this process' values to METRICS_DIR, replacing its previous dump atomically"""
+    global _last_flush, _flushed_pid
+
+    if not METRICS_DIR:
+        return
+
+    with _flush_lock:
+        _last_flush = time.monotonic()
+        pid = os.getpid()
+        path = os.path.join(METRICS_DIR, f'metrics_{pid}.json')
+
+        os.makedirs(METRICS_DIR, exist_ok=True)
+
+        if _flushed_pid != pid and os.path.exists(path):
+            # left by an exited process that had the same pid, keep its counters before replacing the file
+            _fold_dead(path, reused=True)
+
+        with open(path + '.tmp', 'w') as file:
+            json.dump({'pid': pid, 'metrics': snapshot()}, file)
+        os.replace(path + '.tmp', path)
+        _flushed_pid = pid
+
+
+def maybe_flush():
+    """Flush if METRICS_FLUSH_INTERVAL passed, a single float comparison in the common case"""
+    if METRICS_DIR and time.monotonic() - _last_flush > METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@contextmanager
+def _directory_lock():
+    """Lock METRICS_DIR against other processes folding dumps at the same time"""
+    with open(os.path.join(METRICS_DIR, '.lock'), 'w') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+        yield
+
+
+def _load(path: str):
+    """Dump written by flush, None if it is gone or unreadable"""
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _add(merged: dict, metrics: dict, gauges: bool = True):
+    """Add the values of a dump to merged, metric name -> label values -> value"""
+    types = {metric.name: metric.type for metric in REGISTRY}
+
+    for metric_name, values in metrics.items():
+        if metric_name not in merged or (types[metric_name] == 'gauge' and not gauges):
+            continue
+
+        target = merged[metric_name]
+        for labels, value in values:
+            key = tuple(labels)
+            if isinstance(value, list):
+                current = target.get(key)
+                target[key] = value if current is None else [a + b for a, b in zip(current, value)]
+            else:
+                target[key] = target.get(key, 0) + value
+
+
+def _as_dump(merged: dict) -> dict:
+    return {name: [[list(key), value] for key, value in values.items()] for name, values in merged.items()}
+
+
+def _fold_dead(path: str, reused: bool = False):
+    """Add the counters and histograms of the dump at path to DEAD_FILE and remove it
+
+    Args:
+        path (str): dump of a process that exited
+        reused (bool): the pid of the dump runs a new process, fold it even though the pid is alive
+    """
+    with _directory_lock():
+        # another process may have folded it, or a new process with the pid replaced it, meanwhile
+        dump = _load(path)
+
+        if dump is None or (not reused and _pid_alive(dump['pid'])):
+            return
+
+        dead_path = os.path.join(METRICS_DIR, DEAD_FILE)
+        merged = {metric.name: {} for metric in REGISTRY}
+        _add(merged, (_load(dead_path) or {'metrics': {}})['metrics'])
+        _add(merged, dump['metrics'], gauges=False)
+
+        with open(dead_path + '.tmp', 'w') as file:
+            json.dump({'pid': None, 'metrics': _as_dump(merged)}, file)
+        os.replace(dead_path + '.tmp', dead_path)
+        os.remove(path)
+
+
+def collect() -> dict:
+    """Values of every metric merged over all processes sharing METRICS_DIR"""
+    if not METRICS_DIR:
+        return snapshot()
+
+    flush()
+    names = [name for name in os.listdir(METRICS_DIR) if name.startswith('metrics_') and name.endswith('.json')]
+
+    for name in names:
+        pid = name[len('metrics_'):-len('.json')]
+
+        if pid.isdigit() and not _pid_alive(int(pid)):
+            _fold_dead(os.path.join(METRICS_DIR, name))
+
+    merged = {metric.name: {} for metric in REGISTRY}
+
+    for name in os.listdir(METRICS_DIR):
+        if not name.startswith('metrics_') or not name.endswith('.json'):
+            continue
+
+        dump = _load(os.path.join(METRICS_DIR, name))
+
+        if dump is not None:
+            _add(merged, dump['metrics'], gauges=dump['pid'] is not None and _pid_alive(dump['pid']))
+
+    return _as_dump(merged)
+
+
+def _labels(names: tuple, values: list, extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+
+    if extra:
+        pairs.append(extra)
+
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    values = collect()
+    lines = []
+
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+
+        for labels, value in sorted(values.get(metric.name, [])):
+            if metric.type != 'histogram':
+                lines.append(f'{metric.name}{_labels(metric.labelnames, labels)} {value}')
+                continue
+
+            cumulative = 0
+            for bound, count in zip(metric.buckets + ('+Inf',), value[:-1]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{metric.name}_bucket{_labels(metric.labelnames, labels, le)} {cumulative}')
+
+            lines.append(f'{metric.name}_sum{_labels(metric.labelnames, labels)} {value[-1]}')
+            lines.append(f'{metric.name}_count{_labels(metric.labelnames, labels)} {cumulative}')
+
+    return '\n'.join(lines) + '\n'
+
+
+REQUESTS = Counter('codechef_api_requests_total', 'API requests served', ('route', 'method', 'status'))
+REQUEST_DURATION = Histogram('codechef_api_request_duration_seconds', 'API request latency', ('route',))
+STAGE_DURATION = Histogram('codechef_api_stage_duration_seconds', 'Time spent per request stage', ('stage',))
+UPSTREAM_FETCHES = Counter('codechef_upstream_fetches_total', 'Upstream responses by status', ('kind', 'status'))
+UPSTREAM_RETRIES = Counter('codechef_upstream_retries_total', 'Retried upstream requests')
+UPSTREAM_RETRY_SLEEP = Counter('codechef_upstream_retry_sleep_seconds_total', 'Time slept between retries')
+USER_AGENT_EVICTIONS = Counter('codechef_user_agent_evictions_total', 'User agents dropped for being throttled')
+UPSTREAM_BYTES = Counter('codechef_upstream_bytes_total', 'Bytes downloaded from upstream', ('kind',))
+CACHE_REQUESTS = Counter('codechef_cache_requests_total', 'Cache lookups by result (hit, disk_hit or miss)',
+                         ('cache', 'result'))
+EXECUTOR_QUEUE_DEPTH = Gauge('codechef_executor_queue_depth', 'Contest fan-out tasks waiting for a thread')
+SELENIUM_DRIVERS = Gauge('codechef_selenium_drivers', 'Live Selenium webdrivers')
+UPSTREAM_RATE_LIMIT_WAIT = Counter('codechef_upstream_rate_limit_wait_seconds_total',
+                                   'Time spent waiting for the upstream rate limiter')
+CRAWLER_REFRESHES = Counter('codechef_crawler_refreshes_total', 'Watchlist refreshes by section and result',
+                            ('section', 'result'))
+CRAWLER_RATE = Gauge('codechef_crawler_rate', 'Current crawler pace in users per second')
+CRAWLER_OVERDUE = Gauge('codechef_crawler_overdue', 'Watchlist users past their refresh time')
+CRAWLER_REQUESTS_SAVED = Gauge('codechef_crawler_requests_saved',
+                               'Upstream requests saved by adaptive refresh intervals, against the watchlist ones')
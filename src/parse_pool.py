@@ -0,0 +1,92 @@
+#  =========================================================================================
+#  ================================ HTML Parse Offloading ==================================
+#  =========================================================================================
+#
+#  BeautifulSoup parsing is pure Python and holds the GIL, so request threads of one worker parse one page at a
+#  time. With PARSE_WORKERS > 0 pages are parsed in a pool of processes instead: the threads only download the
+#  raw bytes and hand them over, and get a small result model back. Parse functions must be top-level so they
+#  can be pickled, and should return compact results, never bs4 objects.
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from timing import stage
+
+PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', 0))  # 0 parses in the calling thread
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _init_parser():
+    import metrics
+
+    # the parent records the round trip as the parse stage, the stages of the child must not add to it
+    metrics.METRICS_DIR = None
+
+
+def get_pool():
+    """Process pool, started on first use so a pre-forking master never owns one"""
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # forking a threaded worker can copy held locks into the child, start parsers from a clean
+                # server process instead
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                _pool = ProcessPoolExecutor(PARSE_WORKERS, mp_context=context, initializer=_init_parser)
+
+    return _pool
+
+
+def run(parse, content: bytes):
+    """parse(content), in the process pool if PARSE_WORKERS is set
+
+    Args:
+        parse (callable): top-level function taking the raw page
+        content (bytes): raw response body, None if the download failed
+
+    Returns:
+        Any: what parse returns, parsed in the calling thread if a parser process died
+    """
+    if not PARSE_WORKERS:
+        return parse(content)
+
+    pool = get_pool()
+
+    try:
+        # the parent only sees the round trip, parse and extract run in the child
+        with stage('parse'):
+            return pool.submit(parse, content).result()
+
+    except BrokenProcessPool as err:
+        # a parser process died (OOM kill, crash) and the pool refuses all further work, replace it and parse
+        # this page here rather than let it take down the new pool as well
+        print(f'error -> {err}')
+        discard(pool)
+        return parse(content)
+
+
+def discard(pool: ProcessPoolExecutor):
+    """Drop a broken pool, the next run starts a new one"""
+    global _pool
+
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+
+    pool.shutdown(wait=False)
+
+
+def shutdown():
+    """Stop the parser processes, waits for parses in progress"""
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
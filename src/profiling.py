@@ -0,0 +1,141 @@
+# ===================================================================
+# ===================== On-demand CPU profiling =====================
+# ===================================================================
+#
+# Two tools for hot-path analysis in production, both idle unless asked for:
+#   sample_stacks  samples the stacks of all threads for a few seconds and returns them in the collapsed
+#                  format understood by flamegraph.pl, speedscope and inferno
+#   RequestProfile cProfile summary of a single request, including the calls it fans out to other threads
+#                  with context_map
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+MAX_SAMPLE_SECONDS = 60
+DEFAULT_SAMPLE_INTERVAL = 0.005  # in seconds
+
+# cProfile can only be active once per process on recent Python versions
+_profile_lock = threading.Lock()
+# from Python 3.12 on cProfile uses sys.monitoring and sees every thread, before it only the one enabling it
+PROFILES_ALL_THREADS = sys.version_info >= (3, 12)
+
+_request_profile = ContextVar('request_profile', default=None)
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f'{os.path.basename(code.co_filename)}:{code.co_name}'
+
+
+def sample_stacks(seconds: float, interval: float = DEFAULT_SAMPLE_INTERVAL) -> Counter:
+    """Sample the stacks of every other thread
+
+    Args:
+        seconds (float): sampling duration, capped at MAX_SAMPLE_SECONDS
+        interval (float): time between two samples
+
+    Returns:
+        Counter: collapsed stack (root first, frames joined by ;) -> number of samples
+    """
+    own_thread = threading.get_ident()
+    stacks = Counter()
+    deadline = time.monotonic() + min(seconds, MAX_SAMPLE_SECONDS)
+
+    while time.monotonic() < deadline:
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+
+            frames = []
+            while frame is not None:
+                frames.append(_frame_name(frame))
+                frame = frame.f_back
+
+            frames.append(thread_names.get(thread_id, str(thread_id)))
+            stacks[';'.join(reversed(frames))] += 1
+
+        time.sleep(interval)
+
+    return stacks
+
+
+def collapsed(stacks: Counter) -> str:
+    """Render sample_stacks output as `stack count` lines"""
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+
+class RequestProfile:
+    """cProfile of the calling thread between start and stop, plus the calls run through `profiled` in its context
+    (the context_map fan-out)"""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.threads = []  # profiles of calls in other threads
+        self.lock = threading.Lock()
+        self.active = False
+        self.token = None
+
+    def start(self) -> bool:
+        """Start profiling, False if another request is being profiled"""
+        if not _profile_lock.acquire(blocking=False):
+            return False
+
+        self.active = True
+        self.token = _request_profile.set(self)
+        self.profile.enable()
+        return True
+
+    def stop(self):
+        if self.active:
+            self.profile.disable()
+            self.active = False
+            _request_profile.reset(self.token)
+            _profile_lock.release()
+
+    def run(self, fn, *args):
+        """Call fn in another thread of the request, profiled on its own and merged into the summary"""
+        if PROFILES_ALL_THREADS or not self.active:
+            return fn(*args)
+
+        profile = cProfile.Profile()
+        profile.enable()
+
+        try:
+            return fn(*args)
+        finally:
+            profile.disable()
+
+            with self.lock:
+                self.threads.append(profile)
+
+    def summary(self, limit: int = 40, sort: str = 'cumulative') -> str:
+        """Top `limit` functions sorted by `sort`, in the pstats text format"""
+        output = io.StringIO()
+
+        with self.lock:
+            threads = list(self.threads)
+
+        if threads:
+            output.write(f'request thread and {len(threads)} calls in worker threads\n')
+
+        pstats.Stats(self.profile, *threads, stream=output).strip_dirs().sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+
+def profiled(fn, *args):
+    """fn(*args), profiled as part of the request being profiled in the current context if there is one"""
+    request_profile = _request_profile.get()
+
+    if request_profile is None:
+        return fn(*args)
+
+    return request_profile.run(fn, *args)
@@ -1,4 +1,9 @@
-from helper_functions import get_response
+from timing import stage
+from tracing import traced
+from scraping_code.models import ContestResult
+from scraping_code import contest_index
+from scraping_code.contest_meta import contest_metas
+from scraping_code.rankings import fetch_rankings, rankings_path
 from typing import Any
 
 headers = {
@@ -24,6 +29,7 @@ headers = {
 }
 
 
+@traced('contest_endpoint', 'contest_name', 'username')
 def contest_endpoint(contest_name: str, username: str) -> Any:
     """Codechef contest details endpoint
 
@@ -32,47 +38,21 @@ def contest_endpoint(contest_name: str, username: str) -> Any:
         username (str): profile name on codechef
 
     Returns:
-        dict or None: return a dictionaries if the request is successful, otherwise, return None
+        ContestResult or None: return the contest result if the request is successful, otherwise, return None
     """
-    url = f"https://www.codechef.com/api/rankings/{contest_name}?itemsPerPage=100&order=asc&page=1&search={username}&sortBy=rank"
+    # contests with a registered index are answered from their pages fetched once for everyone
+    result = contest_index.lookup(contest_name, username)
 
-    # add aditional details
-    headers["path"] = f"/api/rankings/{contest_name}?itemsPerPage=100&order=asc&page=1&search={username}&sortBy=rank"
-    headers[
-        "referer"] = f"https://www.codechef.com/rankings/{contest_name}?itemsPerPage=100&order=asc&page=1&search={username}&sortBy=rank"
+    if result is not None:
+        return result
 
-    res_data = get_response(url, "json", headers)
-    details = {}
+    res_data = fetch_rankings(rankings_path(contest_name, search=username))
 
-    if res_data is not None:
-        details['contest_code'] = res_data['contest_info']['contest_code']
-        details['contest_name'] = res_data['contest_name']
-        details['rank'] = res_data['list'][0]['rank']
-        details['total_score'] = res_data['list'][0]['score']
+    if res_data is None:
+        return None
 
-        problems_solved = {}
-        total_problems = []
-        total_solved = 0
-
-        for key, value in res_data['list'][0]["problems_status"].items():
-            problems_solved[key] = value
-            problems_solved[key]['question_link'] = f"https://www.codechef.com/LP1TO201/problems/{key}"
-            problems_solved[key]['submission_link'] = \
-                f"https://www.codechef.com/rankings/{contest_name}/bestsolution/{key},{username}"
-            total_solved += 1
-
-        for problem in res_data['problems']:
-            data = problem
-            data['question_link'] = f"https://www.codechef.com/LP1TO201/problems/{data['code']}"
-            total_problems.append(data)
-
-        details['problems_solved'] = problems_solved
-        details['total_problems'] = total_problems
-        details['total_solved'] = total_solved
-
-        return details
-
-    return None
+    with stage('extract'):
+        return ContestResult.from_row(contest_metas.get(res_data), res_data['list'][0], username)
 
 
 if __name__ == "__main__":
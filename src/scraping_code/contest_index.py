@@ -0,0 +1,266 @@
+import json
+import os
+import threading
+import time
+from urllib.parse import quote
+from metrics import CACHE_REQUESTS
+from scraping_code.contest_meta import contest_metas
+from scraping_code.models import ContestResult
+from scraping_code.rankings import iter_pages
+from timing import stage
+from tracing import span
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+CONTEST_INDEX_TTL = int(os.environ.get('CONTEST_INDEX_TTL', 3600))  # in seconds, then the index is rebuilt
+CONTEST_INDEX_RETRY_INTERVAL = int(os.environ.get('CONTEST_INDEX_RETRY_INTERVAL', 300))  # in seconds after a failure
+# contests answered from an index instead of one search per user, comma separated `CONTEST[:Field=value]`,
+# e.g. START51D:Institution=IIT Delhi,START52D
+CONTEST_INDEXES = os.environ.get('CONTEST_INDEXES', '')
+CONTEST_INDEX_CONCURRENCY = int(os.environ.get('CONTEST_INDEX_CONCURRENCY', 2))  # pages fetched ahead
+# directory of the result cache (see API/cache.py), index pages stored there are shared by all workers and the crawler
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR')
+SHARED_POLL_INTERVAL = 10  # seconds between two looks for the pages another process is fetching
+
+
+def parse_spec(spec: str) -> tuple:
+    """(contest code, filter or None) of a `CONTEST[:Field=value]` index spec"""
+    contest, _, filter_by = spec.strip().partition(':')
+    return contest.strip().upper(), filter_by.strip() or None
+
+
+def index_page(res_data: dict, results: dict):
+    """Add the rows of a rankings payload to results, username -> ContestResult"""
+    with stage('extract'):
+        meta = contest_metas.get(res_data)
+
+        for row in res_data['list']:
+            results[row['user_handle'].lower()] = ContestResult.from_row(meta, row, row['user_handle'])
+
+
+class ContestIndex:
+    """Results of every user in the rankings of a contest, fetched page by page instead of one search per user
+
+    With a directory the fetched pages are also stored there, one JSON line per page, with the time they were
+    fetched as mtime. Processes sharing the directory load a fresh file instead of paging the contest again, a
+    file lock lets one of them fetch at a time.
+
+    Args:
+        contest_code (str): contest code on codechef, e.g. START51D
+        filter_by (str): rankings filter like `Institution=IIT Delhi` or `Country=India`, None for everyone
+        directory (str): optional directory shared between processes
+    """
+
+    def __init__(self, contest_code: str, filter_by: str = None, directory: str = RESULT_CACHE_DIR):
+        self.contest_code = contest_code
+        self.filter_by = filter_by
+        self.directory = directory
+        self.results = {}
+        self.built = None  # unix time the pages of the results were fetched at
+        self.next_build = 0.0  # unix time the index is built, loaded or retried at
+        self.lock = threading.Lock()
+
+    @property
+    def expired(self) -> bool:
+        return time.time() >= self.next_build
+
+    @property
+    def path(self) -> str:
+        name = self.contest_code if self.filter_by is None else f'{self.contest_code}:{self.filter_by}'
+        return os.path.join(self.directory, 'contest_index', quote(name, safe='') + '.jsonl')
+
+    def build(self, wait: bool = True) -> bool:
+        """Replace the index with fresh results, from the directory if another process fetched them
+
+        Args:
+            wait (bool): wait for another process fetching the pages, otherwise look again after
+                SHARED_POLL_INTERVAL seconds
+
+        Returns:
+            bool: False if the index was not replaced, the previous one is kept then
+        """
+        try:
+            if not self.directory:
+                return self.fetch()
+
+            if self.load():
+                return True
+
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+            with open(self.path + '.lock', 'w') as lock:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(lock, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        self.next_build = time.time() + SHARED_POLL_INTERVAL
+                        return False
+
+                # the process that held the lock stored fresh pages
+                return self.load() or self.fetch()
+
+        except Exception as err:
+            # also unexpected payloads: do not page the contest again on every lookup, searches answer until the
+            # retry
+            print(f'error -> {self.contest_code} index -> {err!r}')
+            self.next_build = time.time() + CONTEST_INDEX_RETRY_INTERVAL
+            return False
+
+    def fetch(self) -> bool:
+        """Fetch every page, index it and store it in the directory"""
+        with span('build contest index', contest=self.contest_code, filter=self.filter_by) as build_span:
+            results = {}
+            # unique per thread, so a failed fetch never leaves a partial file at path
+            temporary = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp' if self.directory else None
+            file = open(temporary, 'w') if temporary else None
+
+            try:
+                for res_data in iter_pages(self.contest_code, self.filter_by, concurrency=CONTEST_INDEX_CONCURRENCY):
+                    index_page(res_data, results)
+
+                    if file is not None:
+                        file.write(json.dumps(res_data, separators=(',', ':')) + '\n')
+
+            except Exception:
+                if file is not None:
+                    file.close()
+                    os.remove(temporary)
+                raise
+
+            build_span.set('users', len(results))
+
+        if file is not None:
+            file.close()
+            os.replace(temporary, self.path)
+
+        self.replace(results, time.time())
+        return True
+
+    def load(self) -> bool:
+        """Load the pages stored in the directory if they are fresh"""
+        try:
+            built = os.stat(self.path).st_mtime
+        except OSError:
+            return False
+
+        if built + CONTEST_INDEX_TTL <= time.time():
+            return False
+
+        if built == self.built:
+            self.next_build = built + CONTEST_INDEX_TTL
+            return True
+
+        results = {}
+
+        try:
+            with open(self.path) as file:
+                for line in file:
+                    index_page(json.loads(line), results)
+
+        except (OSError, ValueError, KeyError) as err:
+            # fetched again and replaced
+            print(f'error -> {self.path} -> {err!r}')
+            return False
+
+        self.replace(results, built)
+        return True
+
+    def replace(self, results: dict, built: float):
+        self.results = results
+        self.built = built
+        self.next_build = built + CONTEST_INDEX_TTL
+
+    def refresh(self, wait: bool = False):
+        """Build the index if it is missing or expired, once when several threads ask at the same time
+
+        Args:
+            wait (bool): build in the calling thread, otherwise a background thread builds it and the previous
+                results (none before the first build) answer until it is done
+        """
+        if not self.expired:
+            return
+
+        if wait:
+            with self.lock:
+                if self.expired:
+                    self.build()
+            return
+
+        # a build of thousands of rows must not hold up requests, nor have them wait on the lock
+        if not self.lock.acquire(blocking=False):
+            return
+
+        if not self.expired:
+            self.lock.release()
+            return
+
+        # a new thread starts with an empty context, the build is not part of the request's trace
+        threading.Thread(target=self.build_and_release, name=f'contest-index-{self.contest_code}', daemon=True).start()
+
+    def build_and_release(self):
+        try:
+            self.build(wait=False)
+        finally:
+            self.lock.release()
+
+    def get(self, username: str):
+        """Result of username, None if the user is not in the index (yet)"""
+        self.refresh()
+        return self.results.get(username.lower())
+
+
+indexes = {}  # contest code -> list of ContestIndex
+indexes_lock = threading.Lock()
+
+
+def register(contest_code: str, filter_by: str = None) -> ContestIndex:
+    """Answer results of contest_code from a ContestIndex, built on first use"""
+    contest_code = contest_code.upper()
+
+    with indexes_lock:
+        for index in indexes.get(contest_code, ()):
+            if index.filter_by == filter_by:
+                return index
+
+        index = ContestIndex(contest_code, filter_by)
+        indexes.setdefault(contest_code, []).append(index)
+        return index
+
+
+def lookup(contest_code: str, username: str):
+    """Result of username in contest_code from the registered indexes
+
+    Returns:
+        ContestResult or None: None if no index of the contest has the user or it is still being built, search
+            the rankings then
+    """
+    contest_indexes = indexes.get(contest_code.upper())
+
+    if not contest_indexes:
+        return None
+
+    for index in contest_indexes:
+        result = index.get(username)
+
+        if result is not None:
+            CACHE_REQUESTS.inc(cache='contest_index', result='hit')
+            return result
+
+    CACHE_REQUESTS.inc(cache='contest_index', result='miss')
+    return None
+
+
+def build_all():
+    """Build every registered index that is missing or expired, e.g. before a crawl"""
+    with indexes_lock:
+        registered = [index for contest_indexes in indexes.values() for index in contest_indexes]
+
+    for index in registered:
+        index.refresh(wait=True)
+
+
+for spec in filter(str.strip, CONTEST_INDEXES.split(',')):
+    register(*parse_spec(spec))
@@ -0,0 +1,51 @@
+import os
+import threading
+from collections import OrderedDict
+from metrics import CACHE_REQUESTS
+from scraping_code.models import ContestMeta
+
+CONTEST_META_CACHE_SIZE = int(os.environ.get('CONTEST_META_CACHE_SIZE', 4096))  # contests per process
+
+
+class ContestMetaCache:
+    """ContestMeta per contest code, built from the first rankings payload of the contest and reused by every
+    result of it
+
+    Args:
+        size (int): maximum number of contests, least recently used ones are dropped first
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.lock = threading.Lock()
+        self.metas = OrderedDict()
+
+    def get(self, res_data: dict) -> ContestMeta:
+        """Metadata of the contest of a rankings payload"""
+        contest_code = res_data['contest_info']['contest_code']
+
+        with self.lock:
+            meta = self.metas.get(contest_code)
+
+            if meta is not None:
+                self.metas.move_to_end(contest_code)
+
+        # problems can be added while a contest runs
+        if meta is not None and len(meta.problems) == len(res_data['problems']):
+            CACHE_REQUESTS.inc(cache='contest_meta', result='hit')
+            return meta
+
+        CACHE_REQUESTS.inc(cache='contest_meta', result='miss')
+        meta = ContestMeta.from_rankings(res_data)
+
+        with self.lock:
+            self.metas[contest_code] = meta
+            self.metas.move_to_end(contest_code)
+
+            while len(self.metas) > self.size:
+                self.metas.popitem(last=False)
+
+        return meta
+
+
+contest_metas = ContestMetaCache(CONTEST_META_CACHE_SIZE)
@@ -0,0 +1,196 @@
+import sys
+from dataclasses import dataclass
+
+# links in results always point at the public site, even when BASE_URL points at a stand-in server
+CODECHEF_URL = 'https://www.codechef.com'
+
+
+@dataclass
+class UserStats:
+    """Profile information scraped by get_user_stats
+
+    `profile` holds the side navigation fields (username, country, institution, ...) keyed like in the
+    JSON response, their set differs between users.
+    """
+    __slots__ = ('profile', 'total_stars', 'rating', 'division', 'global_rank', 'country_rank',
+                 'problem_fully_solved', 'problem_partially_solved', 'contest_participate', 'badges')
+
+    profile: dict
+    total_stars: int
+    rating: int
+    division: str
+    global_rank: object  # int, or the text codechef shows for unranked users
+    country_rank: object
+    problem_fully_solved: int
+    problem_partially_solved: int
+    contest_participate: int
+    badges: object  # dict of badge name -> level, or the text of a single badge
+
+    @property
+    def username(self) -> str:
+        return self.profile.get('username')
+
+    def to_dict(self) -> dict:
+        data = dict(self.profile)
+        data['total_stars'] = self.total_stars
+        data['rating'] = self.rating
+        data['division'] = self.division
+        data['global_rank'] = self.global_rank
+        data['country_rank'] = self.country_rank
+        data['problem_fully_solved'] = self.problem_fully_solved
+        data['problem_partially_solved'] = self.problem_partially_solved
+        data['contest_participate'] = self.contest_participate
+        data['badges'] = self.badges
+        return data
+
+
+@dataclass
+class Problem:
+    """Problem of a contest"""
+    __slots__ = ('code', 'name')
+
+    code: str
+    name: str
+
+    def to_dict(self, contest_code: str) -> dict:
+        return {
+            'code': self.code,
+            'name': self.name,
+            'question_link': f'{CODECHEF_URL}/{contest_code}/problems/{self.code}'
+        }
+
+
+@dataclass
+class ProblemStatus:
+    """Result of a user on one contest problem"""
+    __slots__ = ('code', 'score', 'penalty', 'time')
+
+    code: str
+    score: float
+    penalty: int
+    time: int
+
+    def to_dict(self, meta: 'ContestMeta', username: str) -> dict:
+        return {
+            'score': self.score,
+            'penalty': self.penalty,
+            'time': self.time,
+            'question_link': meta.question_link(self.code),
+            'submission_link': f'{CODECHEF_URL}/rankings/{meta.contest_code}/bestsolution/{self.code},{username}'
+        }
+
+
+@dataclass
+class ContestMeta:
+    """Name and problems of a contest, the same for every participant and shared by all their results
+
+    `problem_dicts` is the rendered `total_problems` list of the JSON response, built once per contest.
+    """
+    __slots__ = ('contest_code', 'contest_name', 'problems', 'problem_dicts', 'question_links')
+
+    contest_code: str
+    contest_name: str
+    problems: tuple  # of Problem
+    problem_dicts: list  # Problem.to_dict of every problem
+    question_links: dict  # problem code -> question link
+
+    @classmethod
+    def from_rankings(cls, res_data: dict) -> 'ContestMeta':
+        """Build from any /api/rankings/<contest> payload"""
+        contest_code = sys.intern(res_data['contest_info']['contest_code'])
+        problems = tuple(Problem(sys.intern(problem['code']), problem.get('name')) for problem in res_data['problems'])
+        problem_dicts = [problem.to_dict(contest_code) for problem in problems]
+
+        return cls(
+            contest_code=contest_code,
+            contest_name=res_data['contest_name'],
+            problems=problems,
+            problem_dicts=problem_dicts,
+            question_links={problem['code']: problem['question_link'] for problem in problem_dicts}
+        )
+
+    def question_link(self, code: str) -> str:
+        link = self.question_links.get(code)
+        return link if link is not None else f'{CODECHEF_URL}/{self.contest_code}/problems/{code}'
+
+
+@dataclass
+class ContestResult:
+    """Rank, score and solved problems of a user in one contest, see contest_endpoint"""
+    __slots__ = ('username', 'meta', 'rank', 'total_score', 'problems_solved')
+
+    username: str
+    meta: ContestMeta  # shared by every result of the contest
+    rank: int
+    total_score: float
+    problems_solved: tuple  # of ProblemStatus
+
+    @property
+    def contest_code(self) -> str:
+        return self.meta.contest_code
+
+    @property
+    def contest_name(self) -> str:
+        return self.meta.contest_name
+
+    @property
+    def total_problems(self) -> tuple:
+        return self.meta.problems
+
+    @property
+    def total_solved(self) -> int:
+        return len(self.problems_solved)
+
+    @classmethod
+    def from_row(cls, meta: ContestMeta, row: dict, username: str) -> 'ContestResult':
+        """Build from one row of a rankings payload
+
+        Args:
+            meta (ContestMeta): metadata of the contest the row belongs to
+            row (dict): entry of the payload's `list`
+            username (str): profile name on codechef
+        """
+        return cls(
+            username=username,
+            meta=meta,
+            rank=row['rank'],
+            total_score=row['score'],
+            problems_solved=tuple(
+                ProblemStatus(sys.intern(code), status.get('score'), status.get('penalty'), status.get('time'))
+                for code, status in row['problems_status'].items()
+            )
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            'contest_code': self.meta.contest_code,
+            'contest_name': self.meta.contest_name,
+            'rank': self.rank,
+            'total_score': self.total_score,
+            'problems_solved': {
+                status.code: status.to_dict(self.meta, self.username) for status in self.problems_solved
+            },
+            'total_problems': self.meta.problem_dicts,
+            'total_solved': self.total_solved
+        }
+
+
+@dataclass
+class ContestHistory:
+    """Contest results of a user, see multiple_threads_scraping"""
+    __slots__ = ('username', 'contest_details', 'total_contest')
+
+    username: str
+    contest_details: tuple  # of ContestResult, contests that could not be scraped are left out
+    total_contest: int
+
+    @property
+    def total_scraped(self) -> int:
+        return len(self.contest_details)
+
+    def to_dict(self) -> dict:
+        return {
+            'contest_details': [contest.to_dict() for contest in self.contest_details],
+            'total_contest': self.total_contest,
+            'total_scraped': self.total_scraped
+        }
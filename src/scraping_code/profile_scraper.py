@@ -1,12 +1,18 @@
 import re
+import threading
 from concurrent.futures import ThreadPoolExecutor
 from itertools import repeat
-from bs4 import BeautifulSoup, element
-from selenium import webdriver
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.options import Options
+from bs4 import BeautifulSoup
 from scraping_code.codechef_core_api_endpoints import contest_endpoint
-from helper_functions import get_response, BASE_URL
+from helper_functions import context_map, get_response, BASE_URL
+import parse_pool
+from timing import stage
+from metrics import SELENIUM_DRIVERS
+from scraping_code.models import ContestHistory, UserStats
+
+# drivers currently open in this process, so a worker shutting down can close their browsers
+live_drivers = set()
+live_drivers_lock = threading.Lock()
 
 
 def get_all_solved_links(username: str) -> dict:
@@ -16,11 +22,36 @@ def get_all_solved_links(username: str) -> dict:
         username (str): profile name on codechef
 
     Returns:
-        dict: contains two value status and links(all un-scraped link list) or message
+        dict: contains two value status and links(href of every solved question, relative to BASE_URL) or message
     """
     url = f'{BASE_URL}/users/{username}'
-    soup = get_response(url)
+    content = get_response(url, 'bytes')
+
+    return parse_pool.run(_parse_solved_links, content)
+
+
+def _soup(content: bytes):
+    """Parsed page, None if the download failed"""
+    return BeautifulSoup(content, 'html.parser') if content is not None else None
+
+
+def _parse_solved_links(content: bytes) -> dict:
+    """Solved question links of a raw profile page, runs in the parse pool"""
+    with stage('parse'):
+        soup = _soup(content)
+
+    try:
+        with stage('extract'):
+            return _solved_links_from_soup(soup)
+
+    finally:
+        # only plain strings leave this function, free the parsed page right away
+        if soup is not None:
+            soup.decompose()
 
+
+def _solved_links_from_soup(soup: BeautifulSoup) -> dict:
+    """Solved question anchors of a parsed profile page, see get_all_solved_links"""
     try:
         # get all solved questions links
         anchor_tag = soup.find('section', {'class': 'rating-data-section problems-solved'})
@@ -31,7 +62,7 @@ def get_all_solved_links(username: str) -> dict:
                 'message': 'Invalid username'
             }
 
-        links = anchor_tag.find_all('a')
+        links = [anchor.get('href') for anchor in anchor_tag.find_all('a', href=True)]
 
     except AttributeError:
         return {
@@ -51,6 +82,11 @@ def get_driver_object():
     Returns:
         WebDriver (selenium.webdriver.chrome.webdriver.WebDriver): Webdriver object for scraping data using selenium
     """
+    # the browser stack is heavy to import, only workers serving /submission-details load it
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from webdriver_manager.chrome import ChromeDriverManager
+
     try:
         chrome_options = Options()
         chrome_options.add_argument("--disable-extensions")
@@ -61,6 +97,10 @@ def get_driver_object():
 
         # driver object
         driver = webdriver.Chrome(ChromeDriverManager().install(), options=chrome_options)
+        SELENIUM_DRIVERS.inc()
+
+        with live_drivers_lock:
+            live_drivers.add(driver)
 
         return driver
 
@@ -69,6 +109,34 @@ def get_driver_object():
         return None
 
 
+def quit_driver(driver):
+    """Close the browser behind a webdriver object from get_driver_object"""
+    if driver is None:
+        return
+
+    with live_drivers_lock:
+        if driver not in live_drivers:
+            # already closed by quit_all_drivers
+            return
+        live_drivers.remove(driver)
+
+    try:
+        driver.quit()
+    except Exception as err:
+        print(f'error -> {err}')
+    finally:
+        SELENIUM_DRIVERS.dec()
+
+
+def quit_all_drivers():
+    """Close every browser still open in this process, used when a worker exits"""
+    with live_drivers_lock:
+        drivers = list(live_drivers)
+
+    for driver in drivers:
+        quit_driver(driver)
+
+
 def get_user_stats(username: str):
     """Scrapes and returns user profile information from codechef website
 
@@ -76,10 +144,30 @@ def get_user_stats(username: str):
         username (str): user profile name
 
     Returns:
-        JSON: JSON data containing all information about the user profile 
+        UserStats or dict: all information about the user profile, or a status dict if it could not be scraped
     """
     url = BASE_URL + '/users/' + username
-    soup = get_response(url)
+    content = get_response(url, 'bytes')
+
+    return parse_pool.run(_parse_user_stats, content)
+
+
+def _parse_user_stats(content: bytes):
+    """Profile information of a raw profile page, runs in the parse pool"""
+    with stage('parse'):
+        soup = _soup(content)
+
+    try:
+        with stage('extract'):
+            return _user_stats_from_soup(soup)
+
+    finally:
+        if soup is not None:
+            soup.decompose()
+
+
+def _user_stats_from_soup(soup: BeautifulSoup):
+    """Profile information of a parsed profile page, see get_user_stats"""
     data = {}
     stars = 0
 
@@ -156,17 +244,18 @@ def get_user_stats(username: str):
     except AttributeError:
         contest_participate = 0
 
-    data['total_stars'] = stars
-    data['rating'] = rating
-    data['division'] = division
-    data['global_rank'] = global_rank
-    data['country_rank'] = country_rank
-    data['problem_fully_solved'] = problem_fully_solved
-    data['problem_partially_solved'] = problem_partially_solved
-    data['contest_participate'] = contest_participate
-    data['badges'] = badges
-
-    return data
+    return UserStats(
+        profile=data,
+        total_stars=stars,
+        rating=rating,
+        division=division,
+        global_rank=global_rank,
+        country_rank=country_rank,
+        problem_fully_solved=problem_fully_solved,
+        problem_partially_solved=problem_partially_solved,
+        contest_participate=contest_participate,
+        badges=badges
+    )
 
 
 def get_submissions_details(username):
@@ -202,6 +291,9 @@ def get_submissions_details(username):
             'message': 'Internal server error'
         }
 
+    finally:
+        quit_driver(driver)
+
     for index, details in enumerate(graph_details):
         data[keys[index]] = int(details.find('tspan').get_text().encode("ascii", "ignore").decode())
         total += index
@@ -209,23 +301,25 @@ def get_submissions_details(username):
     return data
 
 
-def get_contest_details(username: str, contest: element.Tag):
+def get_contest_details(username: str, contest_name: str):
     """Scrapes and returns contest details of a user from codechef website
 
     Args:
         username (str): user profile name
-        contest (bs4.element.Tag): bs4.element.Tag object containing contest details
+        contest_name (str): contest code as listed on the profile page, None if it could not be read
 
     Returns:
-        dict: containing contest name, links of all solved questions, rank and score of the user
+        ContestResult or None: contest name, solved questions, rank and score of the user, None on failure
     """
+    if contest_name is None:
+        return None
+
     try:
-        contest_name = contest.find('strong').get_text().replace(':', '')
         return contest_endpoint(contest_name, username)
 
     except Exception as err:
         print(f'error -> {err}')
-        return {}
+        return None
 
 
 def multiple_threads_scraping(username: str):
@@ -235,12 +329,50 @@ def multiple_threads_scraping(username: str):
         username (str): user profile name
 
     Returns:
-        dict: containing scraped data, including contest details, the total number of contests participated in and total number of contests scraped.
+        ContestHistory or dict: contest details, the total number of contests participated in and total number of
+        contests scraped, or a status dict if the profile could not be scraped
     """
     url = BASE_URL + '/users/' + username
-    soup = get_response(url)
-    data = {}
+    content = get_response(url, 'bytes')
+
+    contest_participate = parse_pool.run(_parse_contest_names, content)
+
+    if isinstance(contest_participate, dict):
+        return contest_participate
+
+    total_contest = len(contest_participate)
+    contest_details = []
+
+    if total_contest:
+        with ThreadPoolExecutor(min(10, total_contest)) as executor:
+            for contest_detail in context_map(executor, get_contest_details, repeat(username), contest_participate):
+                if contest_detail is not None:
+                    contest_details.append(contest_detail)
+
+    return ContestHistory(username, tuple(contest_details), total_contest)
+
+
+def _parse_contest_names(content: bytes):
+    """Participated contests of a raw profile page, runs in the parse pool"""
+    with stage('parse'):
+        soup = _soup(content)
 
+    try:
+        with stage('extract'):
+            return _contest_names_from_soup(soup)
+
+    finally:
+        if soup is not None:
+            soup.decompose()
+
+
+def _contest_names_from_soup(soup: BeautifulSoup):
+    """Participated contests of a parsed profile page
+
+    Returns:
+        list or dict: contest code per contest (None where it could not be read), or a status dict if the page
+        is not a valid profile
+    """
     try:
         details = soup.find('section', {'class': 'rating-data-section problems-solved'})
         if details is None:
@@ -257,26 +389,13 @@ def multiple_threads_scraping(username: str):
 
     article_tag = details.find('article')
 
-    if article_tag is not None:
-        contest_participate = article_tag.find_all('p')[1:]
-        total_contest = len(contest_participate)
-        total_scraped = 0
-        contest_details = []
+    if article_tag is None:
+        return []
 
-        executor = ThreadPoolExecutor(min(10, max(total_contest, 1)))
+    names = []
 
-        for contest_detail in executor.map(get_contest_details, repeat(username), contest_participate):
-            if len(contest_detail) > 1:
-                contest_details.append(contest_detail)
-                total_scraped += 1
+    for contest in article_tag.find_all('p')[1:]:
+        strong = contest.find('strong')
+        names.append(strong.get_text().replace(':', '') if strong is not None else None)
 
-    else:
-        contest_details = []
-        total_contest = 0
-        total_scraped = 0
-
-    data['contest_details'] = contest_details
-    data['total_contest'] = total_contest
-    data['total_scraped'] = total_scraped
-
-    return data
+    return names
@@ -0,0 +1,118 @@
+#  =========================================================================================
+#  ================================= Contest Rankings API ==================================
+#  =========================================================================================
+#
+#  Requests against /api/rankings/<contest>. iter_pages and iter_rankings walk a whole contest lazily: the next
+#  pages are fetched while the current one is processed, so at most `concurrency + 1` pages are held at a time
+#  however large the contest is. Every page goes through get_response and with it the upstream rate limiter.
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from urllib.parse import quote
+from helper_functions import get_response, RANKINGS_URL
+
+RANKINGS_PAGE_SIZE = int(os.environ.get('RANKINGS_PAGE_SIZE', 100))  # itemsPerPage
+
+
+class RankingsUnavailable(Exception):
+    """A rankings page could not be fetched after all retries"""
+
+
+def rankings_path(contest: str, page: int = 1, page_size: int = RANKINGS_PAGE_SIZE, filter_by: str = None,
+                  search: str = None) -> str:
+    """Path and query of a rankings request
+
+    Args:
+        contest (str): contest code on codechef
+        page (int): page number, starting at 1
+        page_size (int): rows per page
+        filter_by (str): filter like `Institution=IIT Delhi` or `Country=India`
+        search (str): username to search for
+
+    Returns:
+        str: e.g. /api/rankings/START51D?itemsPerPage=100&order=asc&page=1&sortBy=rank
+    """
+    path = f'/api/rankings/{contest}?itemsPerPage={page_size}&order=asc&page={page}'
+
+    if filter_by:
+        path += f'&filterBy={quote(filter_by)}'
+
+    if search:
+        path += f'&search={search}'
+
+    return path + '&sortBy=rank'
+
+
+def fetch_rankings(path: str):
+    """Rankings payload of a rankings_path, None if it could not be fetched"""
+    # imported here, codechef_core_api_endpoints imports the contest indexes which page through this module
+    from scraping_code.codechef_core_api_endpoints import headers
+
+    request_headers = dict(headers, path=path, referer='https://www.codechef.com' + path.replace('/api', '', 1))
+    return get_response(RANKINGS_URL + path[len('/api/rankings'):], 'json', request_headers)
+
+
+def iter_pages(contest: str, filter_by: str = None, page_size: int = RANKINGS_PAGE_SIZE, concurrency: int = 1):
+    """Rankings payloads of every page of a contest, in order
+
+    Args:
+        contest (str): contest code on codechef
+        filter_by (str): filter like `Institution=IIT Delhi`
+        page_size (int): rows per page
+        concurrency (int): pages fetched ahead in parallel, 1 prefetches the next page only
+
+    Yields:
+        dict: rankings payload of one page
+
+    Raises:
+        RankingsUnavailable: a page could not be fetched
+    """
+    def fetch(page: int) -> dict:
+        res_data = fetch_rankings(rankings_path(contest, page, page_size, filter_by))
+
+        if res_data is None:
+            raise RankingsUnavailable(f'{contest} page {page}')
+
+        return res_data
+
+    # the first page tells how many there are
+    first = fetch(1)
+    pages = first.get('availablePages') or 1
+
+    with ThreadPoolExecutor(max(1, concurrency)) as executor:
+        pending = deque()
+        next_page = 2
+
+        def fill():
+            nonlocal next_page
+
+            while next_page <= pages and len(pending) < max(1, concurrency):
+                pending.append(executor.submit(copy_context().run, fetch, next_page))
+                next_page += 1
+
+        try:
+            fill()
+            yield first
+            del first
+
+            while pending:
+                res_data = pending.popleft().result()
+                fill()
+                yield res_data
+
+        finally:
+            # stopped early or failed, do not fetch pages nobody reads
+            for future in pending:
+                future.cancel()
+
+
+def iter_rankings(contest: str, filter_by: str = None, page_size: int = RANKINGS_PAGE_SIZE, concurrency: int = 1):
+    """Rows of the rankings of a contest, in rank order, see iter_pages
+
+    Yields:
+        dict: one entry of a page's `list`
+    """
+    for res_data in iter_pages(contest, filter_by, page_size, concurrency):
+        yield from res_data['list']
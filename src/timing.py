@@ -0,0 +1,97 @@
+# ===================================================================
+# ==================== Per-stage timing of requests =================
+# ===================================================================
+#
+# Stages recorded while serving a request (ttfb, download, parse, extract, serialize, retry_sleep) are
+# summed per request, sent back as a Server-Timing header and folded into the stage duration histogram.
+# Stages of the contest fan-out run in parallel threads, so their sums can be larger than the wall time.
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from metrics import STAGE_DURATION
+
+_request_timings = ContextVar('request_timings', default=None)
+
+
+class StageTimings:
+    """Stage durations and downloaded bytes of one request"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.bytes = 0
+
+    def add(self, name: str, seconds: float, size: int = 0):
+        with self.lock:
+            total, count = self.stages.get(name, (0.0, 0))
+            self.stages[name] = (total + seconds, count + 1)
+            self.bytes += size
+
+    def server_timing(self) -> str:
+        """Value of the Server-Timing header, durations in milliseconds"""
+        with self.lock:
+            metrics = [f'{name};dur={total * 1000:.1f};desc="{count} calls"'
+                       for name, (total, count) in self.stages.items()]
+
+            if self.bytes:
+                metrics.append(f'bytes;desc="{self.bytes}"')
+
+        metrics.append(f'total;dur={(time.perf_counter() - self.start) * 1000:.1f}')
+        return ', '.join(metrics)
+
+
+def start_request() -> StageTimings:
+    """Begin collecting stage timings for the request running in the current context"""
+    timings = StageTimings()
+    _request_timings.set(timings)
+    return timings
+
+
+def current() -> StageTimings:
+    """Timings of the current request, None outside of a request"""
+    return _request_timings.get()
+
+
+def record(name: str, seconds: float, size: int = 0):
+    """Add a finished stage to the current request and the histograms
+
+    Args:
+        name (str): stage name, e.g. parse or retry_sleep
+        seconds (float): stage duration
+        size (int): bytes transferred during the stage
+    """
+    STAGE_DURATION.observe(seconds, stage=name)
+    timings = _request_timings.get()
+
+    if timings is not None:
+        timings.add(name, seconds, size)
+
+
+@contextmanager
+def stage(name: str):
+    """Time the body of a with block as stage `name`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def histograms() -> dict:
+    """Stage histograms of this process, bucket bounds in milliseconds with cumulative counts"""
+    snapshot = {}
+
+    for (name,), counts in sorted(STAGE_DURATION.dump()):
+        buckets = {}
+        cumulative = 0
+
+        for bound, count in zip(STAGE_DURATION.buckets + ('+Inf',), counts[:-1]):
+            cumulative += count
+            buckets[f'{bound * 1000:g}' if bound != '+Inf' else bound] = cumulative
+
+        snapshot[name] = {'count': cumulative, 'sum_ms': round(counts[-1] * 1000, 3), 'buckets_ms': buckets}
+
+    return snapshot
@@ -0,0 +1,251 @@
+# ===================================================================
+# ==================== Request tracing spans ========================
+# ===================================================================
+#
+# OpenTelemetry style spans without a collector: every API request opens a root span, upstream fetches,
+# retry attempts and contest_endpoint calls open child spans. Finished spans are written as JSON lines
+# by the exporter picked with TRACING_EXPORTER:
+#   file   (default) append to TRACE_FILE
+#   stdout print every span
+#   none   tracing disabled
+# An incoming W3C `traceparent` header continues the caller's trace and its sampling decision. Other traces are
+# kept with probability TRACE_SAMPLE_RATE, decided at the root span and inherited by all its children. The
+# trace file is rotated to TRACE_FILE.1 once it reaches TRACE_FILE_MAX_BYTES.
+
+import functools
+import inspect
+import json
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+TRACING_EXPORTER = os.environ.get('TRACING_EXPORTER', 'file')
+TRACE_FILE = os.environ.get('TRACE_FILE', 'traces.jsonl')
+TRACE_FILE_MAX_BYTES = int(os.environ.get('TRACE_FILE_MAX_BYTES', 50 * 2 ** 20))  # 0 never rotates
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 1))  # share of traces exported
+
+TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+ROTATE_CHECK_INTERVAL = 1  # in seconds, how often the trace file size is checked
+
+_current_span = ContextVar('current_span', default=None)
+
+
+class Span:
+    """Timed unit of work inside a trace"""
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'attributes', 'status')
+
+    def __init__(self, name: str, trace_id: str, parent_id: str = None, attributes: dict = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.status = 'OK'
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_status(self, status: str):
+        self.status = status
+
+    def record_error(self, err: Exception):
+        self.status = 'ERROR'
+        self.attributes['exception.type'] = type(err).__name__
+        self.attributes['exception.message'] = str(err)
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id,
+            'startTimeUnixNano': self.start_ns,
+            'endTimeUnixNano': self.end_ns,
+            'durationMs': round((self.end_ns - self.start_ns) / 1e6, 3),
+            'attributes': self.attributes,
+            'status': self.status,
+        }
+
+
+class NoopSpan:
+    """Returned when tracing is disabled or the trace is not sampled, accepts and drops everything"""
+    __slots__ = ()
+
+    def set(self, key: str, value):
+        pass
+
+    def set_status(self, status: str):
+        pass
+
+    def record_error(self, err: Exception):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class JsonLinesExporter:
+    """Writes finished spans as JSON lines to a file or stdout"""
+
+    def __init__(self, target: str, max_bytes: int = 0):
+        self.target = target
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.file = None
+        self.checked = 0
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), separators=(',', ':'), default=str)
+
+        with self.lock:
+            if self.target == 'stdout':
+                sys.stdout.write(line + '\n')
+                return
+
+            if self.file is not None and time.monotonic() - self.checked > ROTATE_CHECK_INTERVAL:
+                self.rotate()
+
+            if self.file is None:
+                # line buffered, whole lines of several processes appending to the same file do not interleave
+                self.file = open(self.target, 'a', buffering=1, encoding='utf-8')
+                self.checked = time.monotonic()
+
+            self.file.write(line + '\n')
+
+    def rotate(self):
+        """Move a full trace file to TRACE_FILE.1, and reopen the file if another process moved it already"""
+        self.checked = time.monotonic()
+
+        try:
+            current = os.stat(self.target)
+            moved = current.st_ino != os.fstat(self.file.fileno()).st_ino
+
+            if not moved and self.max_bytes and current.st_size >= self.max_bytes:
+                os.replace(self.target, self.target + '.1')
+                moved = True
+
+        except OSError:
+            moved = True
+
+        if moved:
+            self.file.close()
+            self.file = None
+
+
+if TRACING_EXPORTER == 'none':
+    exporter = None
+else:
+    exporter = JsonLinesExporter('stdout' if TRACING_EXPORTER == 'stdout' else TRACE_FILE, TRACE_FILE_MAX_BYTES)
+
+
+def start_span(name: str, traceparent: str = None, **attributes):
+    """Open a span as child of the current one and make it current
+
+    Args:
+        name (str): span name
+        traceparent (str): W3C traceparent header, only used when there is no current span
+        **attributes: initial span attributes
+
+    Returns:
+        tuple: (span, token), pass both to end_span
+    """
+    if exporter is None:
+        return NOOP_SPAN, None
+
+    parent = _current_span.get()
+
+    if parent is NOOP_SPAN:
+        # inside a trace that is not sampled
+        return NOOP_SPAN, None
+
+    if parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    else:
+        match = TRACEPARENT.match(traceparent or '')
+
+        if match:
+            trace_id, parent_id, flags = match.groups()
+            sampled = int(flags, 16) & 1
+        else:
+            trace_id, parent_id = secrets.token_hex(16), None
+            sampled = random.random() < TRACE_SAMPLE_RATE
+
+        if not sampled:
+            # current for the children, so they skip the trace as well
+            return NOOP_SPAN, _current_span.set(NOOP_SPAN)
+
+    span = Span(name, trace_id, parent_id, attributes)
+    return span, _current_span.set(span)
+
+
+def end_span(span, token):
+    """Close a span from start_span, restore its parent as current and export it"""
+    if token is None:
+        return
+
+    try:
+        _current_span.reset(token)
+    except ValueError:
+        # ended from another context than it was started in
+        _current_span.set(None)
+
+    if span is NOOP_SPAN:
+        return
+
+    span.end_ns = time.time_ns()
+    exporter.export(span)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Trace the body of a with block, exceptions mark the span as failed and are re-raised"""
+    current, token = start_span(name, **attributes)
+
+    try:
+        yield current
+    except Exception as err:
+        current.record_error(err)
+        raise
+    finally:
+        end_span(current, token)
+
+
+def traced(name: str, *arg_names: str):
+    """Decorator tracing every call of a function
+
+    Args:
+        name (str): span name
+        *arg_names (str): names of the function arguments recorded as span attributes
+    """
+    def decorator(func):
+        if exporter is None:
+            return func
+
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            arguments = signature.bind(*args, **kwargs).arguments
+            attributes = {arg_name: arguments.get(arg_name) for arg_name in arg_names}
+
+            with span(name, **attributes) as current:
+                result = func(*args, **kwargs)
+                current.set('empty_result', not result)
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+def current_span():
+    """Span of the running context, None outside of a trace"""
+    return _current_span.get()